@@ -5,23 +5,106 @@
 
 
 # Standard library imports
-from dataclasses import dataclass, field, fields
-from typing import Optional, List
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional, List, Tuple
 import copy
+import calendar  # For expand_dates method
 from datetime import datetime  # For vali_date method
+import os
+import json
+import hashlib  # For PersonList.diff method
+from operator import attrgetter
+from functools import lru_cache, partial  # For the linked data export
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed  # For update_db_staged method
+import asyncio  # For PersonLookupService
+from collections import OrderedDict, deque, Counter
+from pathlib import Path
+from contextlib import contextmanager  # For ColumnarPersonList.batch
 
 # Third-party dependencies
 import pandas as pd  # For to_csv method
+import numpy as np  # For validate_frame method
 from sqlalchemy import create_engine, MetaData
 from sqlalchemy.orm import mapper, sessionmaker
 from sqlalchemy.exc import OperationalError
 from tqdm import tqdm  # For progress bar in update_db method
 import re
+import sqlite3  # For the appellation search index and update_db_staged method
+import warnings  # For update_db_sharded
+import unicodedata  # For StringNormalization
+import queue  # For write_csv_concurrent
+import threading
+import gzip
+import bz2
 
 
 # In[1]:
 
 
+@dataclass(frozen=True)
+class StringNormalization:
+    """
+    How string values are normalized when instances are made, lowercased and linked: lowercased (or casefolded with
+    casefold=True, which also matches e.g. 'ß' with 'ss'), then put in one Unicode normalization form, so composed and
+    decomposed characters (NFC/NFD) compare equal. unicode_form None skips that step.
+    Normalized values are memoized, for at most cache_size distinct strings.
+    """
+    casefold: bool = False
+    unicode_form: Optional[str] = 'NFC'
+    cache_size: int = 65536
+
+    def __post_init__(self):
+        if self.unicode_form not in (None, 'NFC', 'NFD', 'NFKC', 'NFKD'):
+            raise ValueError(f"{self.unicode_form} is not a Unicode normalization form, use NFC, NFD, NFKC, NFKD or None")
+
+    def normalizer(self):
+        """A memoized function from a raw string to its normalized form."""
+        fold = str.casefold if self.casefold else str.lower
+        form = self.unicode_form
+
+        @lru_cache(maxsize=self.cache_size)
+        def normalize(value: str) -> str:
+            value = fold(value)
+            return unicodedata.normalize(form, value) if form else value
+
+        return normalize
+
+
+_normalization = StringNormalization()
+_normalize = _normalization.normalizer()
+
+
+def set_normalization(normalization: StringNormalization) -> StringNormalization:
+    """
+    Use another StringNormalization from now on, e.g. set_normalization(StringNormalization(casefold=True)).
+    Instances that already exist are not changed.
+
+    Returns:
+        StringNormalization: the normalization that was used before, to restore it
+    """
+    global _normalization, _normalize
+    previous = _normalization
+    _normalization, _normalize = normalization, normalization.normalizer()
+    return previous
+
+
+def normalize_string(value):
+    """Normalize a value like the string fields of new instances; values that are not strings are returned as they are."""
+    return _normalize(value) if isinstance(value, str) else value
+
+
+def _mapping_key(mapping: dict, value):
+    """The key of a linking mapping for a value: the value itself, or else its normalized form, or None if neither is in it."""
+    if value in mapping:
+        return value
+    if isinstance(value, str):
+        normalized = _normalize(value)
+        if normalized in mapping:
+            return normalized
+    return None
+
+
 @dataclass
 class PersonAttribute:
     """Base class for observation-related entities."""
@@ -43,15 +126,11 @@ class PersonAttribute:
     comment: Optional[str] = None
         
     def __post_init__(self):
-        # First, lowercase all string fields except original_label
-        self._lowercase_string_fields()
+        # First, normalize all string fields except original_label
+        self._normalize_string_fields()
         
         #validate dates after initialization
-        date_fields = [
-            "annotationDate", "startDate", "endDate", "startDate_min", "startDate_max", "endDate_min", "endDate_max"            
-        ]
-        
-        for field_name in date_fields:
+        for field_name in self._date_fields:
             date_value = getattr(self, field_name)
             
             if date_value == '-1':
@@ -63,22 +142,25 @@ class PersonAttribute:
                     'It can be yyyy, yyyy-mm, or yyyy-mm-dd, or -1 for unknown dates.'
                 )
     
-    def _lowercase_string_fields(self):
-        """Convert all string field values to lowercase except original_label."""
-        # Get all fields for this instance's class
-        class_fields = fields(self)
-        
-        # Process each field
-        for field in class_fields:
-            value = getattr(self, field.name)
-            
-            # Skip None values and original_label field
-            if value is None or field.name == 'original_label':
-                continue
-                
-            # Convert string values to lowercase
+    _normalized_fields_by_class = {}
+    
+    @classmethod
+    def _normalized_fields(cls) -> tuple:
+        """The names of the fields that are normalized, worked out once per class."""
+        names = PersonAttribute._normalized_fields_by_class.get(cls)
+        if names is None:
+            names = tuple(f.name for f in fields(cls) if f.name != 'original_label')
+            PersonAttribute._normalized_fields_by_class[cls] = names
+        return names
+    
+    def _normalize_string_fields(self):
+        """Normalize all string field values except original_label, see StringNormalization."""
+        normalize = _normalize
+        values = self.__dict__
+        for name in self._normalized_fields():
+            value = values[name]
             if isinstance(value, str) and value:
-                setattr(self, field.name, value.lower())
+                values[name] = normalize(value)
     
     @staticmethod
     def vali_date(date_string: str) -> bool:
@@ -107,6 +189,119 @@ class PersonAttribute:
         
         return False
 
+    _date_fields = ("annotationDate", "startDate", "endDate", "startDate_min", "startDate_max", "endDate_min", "endDate_max")
+
+    # Same building blocks as datetime.strptime uses for %Y, %m and %d, so validate_frame
+    # accepts exactly the strings that vali_date accepts
+    _date_pattern = r'^(\d\d\d\d)(?:-(1[0-2]|0[1-9]|[1-9])(?:-(3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9]))?)?$'
+    _days_in_month = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+    @classmethod
+    def validate_frame(cls, frame: pd.DataFrame) -> pd.Series:
+        """
+        Validates the date columns of a whole table of candidate rows at once,
+        with the same rules as __post_init__ but without building any objects.
+        Missing columns, missing values (None/NaN) and '-1' count as valid.
+
+        Args:
+            frame: a DataFrame with one row per candidate instance, columns named after the fields
+
+        Returns:
+            pd.Series: per row an empty string if it is valid, or the reasons why it is not
+        """
+        reasons = pd.Series('', index=frame.index, dtype=object)
+
+        for field_name in cls._date_fields:
+            if field_name not in frame.columns:
+                continue
+
+            column = frame[field_name]
+            is_string = column.map(lambda value: isinstance(value, str)).astype(bool)
+            checked = column.notna() & (column != '-1')
+
+            parts = column.where(is_string, '').astype(str).str.extract(cls._date_pattern)
+            year = cls._parse_numbers(parts[0]).to_numpy()
+            month = cls._parse_numbers(parts[1]).fillna(1).to_numpy()
+            day = cls._parse_numbers(parts[2]).fillna(1).to_numpy()
+
+            #check the day against the length of the month, leap years included
+            leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+            month_index = np.clip(month, 1, 12).astype(int) - 1
+            last_day = cls._days_in_month[month_index] + ((month_index == 1) & leap)
+            valid = is_string.to_numpy() & (year >= 1) & (day <= last_day)
+
+            invalid = checked.to_numpy() & ~valid
+            if invalid.any():
+                message = f'{field_name} "' + column[invalid].astype(str) + '" is not a valid date'
+                reasons[invalid] = np.where(reasons[invalid] == '', message, reasons[invalid] + '; ' + message)
+
+        return reasons
+
+    @staticmethod
+    def _parse_numbers(part: pd.Series) -> pd.Series:
+        """Parse extracted date parts to numbers, falling back to int() for non-ASCII digits like strptime accepts."""
+        numbers = pd.to_numeric(part, errors='coerce')
+        missed = numbers.isna() & part.notna()
+        if missed.any():
+            numbers[missed] = part[missed].map(int)
+        return numbers
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, quarantine_file: Optional[str] = None):
+        """
+        Builds instances for every valid row of a table of candidate rows, instead of stopping at the first invalid date.
+        The table is validated column-wise with validate_frame first; rows that fail are quarantined
+        together with their reasons, and only the rows that passed are built. Those skip the per-instance
+        date validation of __post_init__, but are lowercased and have '-1' dates removed in the same way.
+        Columns that are not fields of the class (e.g. URI) are ignored, so they can be used to group the result.
+
+        Args:
+            frame: a DataFrame with one row per candidate instance, columns named after the fields.
+            Read source CSVs with dtype=str: like in __post_init__, dates that are not strings are invalid.
+            quarantine_file: if given, the quarantined rows and their reasons are appended to this CSV file
+
+        Returns:
+            tuple: a Series of instances with the index of the valid rows, and a DataFrame with the quarantined rows and a 'reason' column
+        """
+        reasons = cls.validate_frame(frame)
+        passed = reasons == ''
+
+        quarantined = frame[~passed].assign(reason=reasons[~passed])
+        if quarantine_file and not quarantined.empty:
+            quarantined.to_csv(quarantine_file, mode='a', header=not os.path.exists(quarantine_file), encoding='UTF-8')
+
+        field_names = [f.name for f in fields(cls)]
+        valid = frame.loc[passed, [c for c in field_names if c in frame.columns]]
+        valid = valid.astype(object).where(valid.notna(), None)
+
+        #normalize and remove '-1' dates column by column instead of per instance
+        for column_name in valid.columns:
+            column = valid[column_name]
+            if column_name in cls._date_fields:
+                column = column.where(column != '-1', None)
+            if column_name != 'original_label':
+                is_string = column.map(lambda value: isinstance(value, str)).astype(bool)
+                if is_string.any():
+                    column = column.where(~is_string, column[is_string].map(_normalize))
+            valid[column_name] = column
+
+        defaults = dict.fromkeys(field_names)
+        columns = list(valid.columns)
+        instances = pd.Series(
+            [cls._from_validated(defaults, columns, row) for row in valid.itertuples(index=False, name=None)],
+            index=valid.index,
+            dtype=object
+        )
+        return instances, quarantined
+
+    @classmethod
+    def _from_validated(cls, defaults: dict, columns: list, row: tuple):
+        """Build an instance from a row that already passed from_frame, without running __post_init__ again."""
+        instance = cls.__new__(cls)
+        instance.__dict__.update(defaults)
+        instance.__dict__.update(zip(columns, row))
+        return instance
+
 
 # In[3]:
 
@@ -255,31 +450,8 @@ class Person:
         #make a new list
         new_p_attrs = []
         
-        #check against exceptions
         for a in attr_list:
-            value = getattr(a, field_name)
-            if not value or value.strip() in exceptions:
-                new_p_attrs.append(a)
-                continue
-        
-            #split
-            split_parts = [value]
-            
-            for sep in separators:
-                split_parts = [part.strip() for val in split_parts for part in val.split(sep)]
-                
-            # Filter out unused_remains
-            split_parts = [part for part in split_parts if part and part not in unused_remains]    
-
-            #for every split do a deepcopy, alter and append
-            if len(split_parts) <= 1:
-                new_p_attrs.append(a)
-                
-            else:
-                for part in split_parts:
-                    new_attr = copy.deepcopy(a)
-                    setattr(new_attr, field_name, part)
-                    new_p_attrs.append(new_attr)
+            new_p_attrs.extend(self._split_attribute(a, field_name, separators, unused_remains, exceptions))
         
         #replace old with new
         setattr(self, attribute_name, new_p_attrs)
@@ -314,16 +486,155 @@ class Person:
         unmatched = set()
         
         for attr in attr_list:
-            current_value = getattr(attr, field_name)
-            if current_value in mapping:
-                setattr(attr, field_name, mapping[current_value])
-            elif current_value is not None:
-                unmatched.add(current_value)
+            self._link_attribute(attr, mapping, field_name, unmatched)
                 
         if unmatched:
             with open(log_file, "a", encoding="utf-8") as f:
                 for val in unmatched:
                     f.write(f"{val}\n")
+    
+    def lowercase_values(self, attribute_name: str, field_name: str):
+        """
+        Lowercases the values in a specified field of PersonAttribute instances, 
+        e.g. for original_label, which is not lowercased when the instances are made.
+        
+        Args:
+            attribute_name: Name of the list of PersonAttribute instances (e.g. 'active_as')
+            field_name: Name of the field in those instances to lowercase (e.g. 'original_label')
+        """
+        
+        #first check if it is a valid request
+        attr_list = getattr(self, attribute_name, None)
+        if not isinstance(attr_list, list):
+            raise AttributeError(f"{attribute_name} is not a valid Person Attribute")
+        
+        #then check if there is anything in the list
+        if not attr_list:
+            return
+        
+        #then check if the field value is legit
+        if not hasattr(attr_list[0], field_name):
+            raise AttributeError(f"{field_name} is not a valid field for {attribute_name}")
+        
+        for attr in attr_list:
+            self._lowercase_attribute(attr, field_name)
+    
+    def expand_dates(self, attribute_name: str, field_name: str):
+        """
+        Fills the _min and _max bounds of a date field from the date itself, where they are still empty.
+        A year expands to the whole year, a month to the whole month, a full date to that day.
+        
+        Args:
+            attribute_name: Name of the list of PersonAttribute instances (e.g. 'active_as')
+            field_name: The date field to expand, 'startDate' or 'endDate'
+        """
+        
+        if field_name not in ('startDate', 'endDate'):
+            raise AttributeError(f"{field_name} is not a date field with bounds, use startDate or endDate")
+        
+        #first check if it is a valid request
+        attr_list = getattr(self, attribute_name, None)
+        if not isinstance(attr_list, list):
+            raise AttributeError(f"{attribute_name} is not a valid Person Attribute")
+        
+        #then check if there is anything in the list
+        if not attr_list:
+            return
+        
+        #then check if the field value is legit
+        if not hasattr(attr_list[0], field_name):
+            raise AttributeError(f"{field_name} is not a valid field for {attribute_name}")
+        
+        for attr in attr_list:
+            self._expand_attribute_date(attr, field_name)
+    
+    # The single-attribute steps below are shared by the methods above and by PersonListPipeline
+    
+    @staticmethod
+    def _split_attribute(a, field_name: str, separators: List[str], unused_remains: List[str], exceptions: List[str]) -> list:
+        """Split one instance on the separators, returning it unchanged or a copy per part."""
+        value = getattr(a, field_name)
+        
+        #check against exceptions
+        if not value or value.strip() in exceptions:
+            return [a]
+        
+        #split
+        split_parts = [value]
+        
+        for sep in separators:
+            split_parts = [part.strip() for val in split_parts for part in val.split(sep)]
+            
+        # Filter out unused_remains
+        split_parts = [part for part in split_parts if part and part not in unused_remains]    
+
+        if len(split_parts) <= 1:
+            return [a]
+        
+        #for every split do a deepcopy, alter and append
+        new_attrs = []
+        for part in split_parts:
+            new_attr = copy.deepcopy(a)
+            setattr(new_attr, field_name, part)
+            new_attrs.append(new_attr)
+        return new_attrs
+    
+    @staticmethod
+    def _link_attribute(attr, mapping: dict, field_name: str, unmatched: set) -> bool:
+        """Replace the value of one instance with its mapping, collecting it in unmatched if there is none."""
+        current_value = getattr(attr, field_name)
+        key = _mapping_key(mapping, current_value)
+        if key is not None:
+            setattr(attr, field_name, mapping[key])
+            return True
+        elif current_value is not None:
+            unmatched.add(current_value)
+        return False
+    
+    @staticmethod
+    def _lowercase_attribute(attr, field_name: str) -> bool:
+        """Normalize the value of one instance if it is a string, see StringNormalization."""
+        value = getattr(attr, field_name)
+        if isinstance(value, str) and value != _normalize(value):
+            setattr(attr, field_name, _normalize(value))
+            return True
+        return False
+    
+    @staticmethod
+    def _date_bounds(value):
+        """The first and last day a date stands for: a year expands to the whole year, a month to the whole month."""
+        if value is None:
+            return None
+        
+        parts = value.split('-')
+        try:
+            year = int(parts[0])
+            if len(parts) == 1:
+                return (f"{parts[0]}-01-01", f"{parts[0]}-12-31")
+            elif len(parts) == 2:
+                month = int(parts[1])
+                last_day = calendar.monthrange(year, month)[1]
+                return (f"{parts[0]}-{month:02d}-01", f"{parts[0]}-{month:02d}-{last_day:02d}")
+            elif len(parts) == 3:
+                month, day = int(parts[1]), int(parts[2])
+                return (f"{parts[0]}-{month:02d}-{day:02d}",) * 2
+        except (ValueError, IndexError, calendar.IllegalMonthError):
+            pass
+        return None
+    
+    @staticmethod
+    def _expand_attribute_date(attr, field_name: str) -> bool:
+        """Fill the empty _min/_max bounds of one instance from its date."""
+        bounds = Person._date_bounds(getattr(attr, field_name))
+        if bounds is None:
+            return False
+        
+        changed = False
+        for bound_field, bound in zip((f"{field_name}_min", f"{field_name}_max"), bounds):
+            if getattr(attr, bound_field) is None:
+                setattr(attr, bound_field, bound)
+                changed = True
+        return changed
 
 
 # In[26]:
@@ -345,6 +656,15 @@ class PersonList:
         """convert None values to '-1 for CSV export"""
         return '-1' if value is None else value
     
+    @staticmethod
+    def _write_frame(frame, filename, directory, append, **kwargs):
+        """write one export frame, appending it to an existing file if requested"""
+        path = os.path.join(directory, filename)
+        if append and os.path.exists(path):
+            frame.to_csv(path, mode='a', header=False, **kwargs)
+        else:
+            frame.to_csv(path, **kwargs)
+    
     def split_list_values(self, attribute_name: str, field_name: str, separators: List[str], unused_remains: List[str], exceptions: List[str]):
         for p in self.persons:
             p.split_values(attribute_name, field_name, separators, unused_remains, exceptions)
@@ -365,7 +685,15 @@ class PersonList:
         for p in self.persons:
             p.link_values(mapping, attribute_name, field_name, log_file)
     
-    def to_csv(self, makeOverview=True, makeAppellations=True, makeActive_as=True, makeIdentities=True, makeStatuses=True, makeLocation_relations=True, makeRelations=True, makeEvents=True, makeExternalReferences=True):
+    def lowercase_list_values(self, attribute_name: str, field_name: str):
+        for p in self.persons:
+            p.lowercase_values(attribute_name, field_name)
+    
+    def expand_list_dates(self, attribute_name: str, field_name: str):
+        for p in self.persons:
+            p.expand_dates(attribute_name, field_name)
+    
+    def to_csv(self, makeOverview=True, makeAppellations=True, makeActive_as=True, makeIdentities=True, makeStatuses=True, makeLocation_relations=True, makeRelations=True, makeEvents=True, makeExternalReferences=True, directory='.', append=False):
         """
         Export person data to CSV files.
 
@@ -379,6 +707,8 @@ class PersonList:
         - makeRelations: Whether to create a CSV with relation data
         - makeEvents: Whether to create a CSV with event data
         - makeExternalReferences: Whether to create a CSV with external reference data
+        - directory: The directory to write the CSV files to
+        - append: Whether to add the rows to existing CSV files (without repeating the header) instead of replacing them
     """
     
         if makeOverview:
@@ -388,7 +718,7 @@ class PersonList:
             for p in self.persons:
                 overviewFrame.append([p.URI, p.rdfs_label, self._format_value(p.comment)])
             overviewFrame = pd.DataFrame(overviewFrame, columns=['URI', 'rdfs:label', 'Comment'])
-            overviewFrame.to_csv('overview.csv')
+            self._write_frame(overviewFrame, 'overview.csv', directory, append)
 
         if makeAppellations:
             appellationsFrame = []
@@ -421,7 +751,7 @@ class PersonList:
                                                    'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                                    'Toponym', 'Toponym_Location', 'Observation source', 'Location in Observation Source', 
                                                    'Reconstruction Source', 'Location in Reconstruction Source', 'Comment'])
-            appellationsFrame.to_csv('appellations.csv', encoding="UTF-8")
+            self._write_frame(appellationsFrame, 'appellations.csv', directory, append, encoding="UTF-8")
 
         if makeActive_as:
             activeAsFrame = []
@@ -458,7 +788,7 @@ class PersonList:
                                                'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                                'Observation source', 'Location in Observation Source', 'Reconstruction Source', 
                                                'Location in Reconstruction Source', 'Comment'])
-            activeAsFrame.to_csv('activities.csv', encoding="UTF-8")
+            self._write_frame(activeAsFrame, 'activities.csv', directory, append, encoding="UTF-8")
 
         if makeIdentities:
             identitiesFrame = []
@@ -472,7 +802,7 @@ class PersonList:
                         self._format_value(identity.identity),
                         self._format_value(identity.identityType),
                         self._format_value(identity.location),
-                        self._format_value(a.location_original),
+                        self._format_value(identity.location_original),
                         self._format_value(identity.annotationDate),
                         self._format_value(identity.startDate),
                         self._format_value(identity.endDate),
@@ -493,7 +823,7 @@ class PersonList:
                                                  'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                                  'Observation source', 'Location in Observation Source',
                                                  'Reconstruction Source', 'Location in Reconstruction Source', 'Comment'])
-            identitiesFrame.to_csv('identities.csv', encoding="UTF-8")
+            self._write_frame(identitiesFrame, 'identities.csv', directory, append, encoding="UTF-8")
 
         if makeStatuses:
             statusesFrame = []
@@ -507,7 +837,7 @@ class PersonList:
                         self._format_value(status.status),
                         self._format_value(status.statusType),
                         self._format_value(status.location),
-                        self._format_value(a.location_original),
+                        self._format_value(status.location_original),
                         self._format_value(status.annotationDate),
                         self._format_value(status.startDate),
                         self._format_value(status.endDate),
@@ -528,7 +858,7 @@ class PersonList:
                                                'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                                'Observation source', 'Location in Observation Source',
                                                'Reconstruction Source', 'Location in Reconstruction Source', 'Comment'])
-            statusesFrame.to_csv('statuses.csv', encoding="UTF-8")
+            self._write_frame(statusesFrame, 'statuses.csv', directory, append, encoding="UTF-8")
 
         if makeLocation_relations:
             locationRelationFrame = []
@@ -541,7 +871,7 @@ class PersonList:
                         self._format_value(lr.original_label),
                         self._format_value(lr.locationRelation),
                         self._format_value(lr.location),
-                        self._format_value(a.location_original),
+                        self._format_value(lr.location_original),
                         self._format_value(lr.annotationDate),
                         self._format_value(lr.startDate),
                         self._format_value(lr.endDate),
@@ -562,7 +892,7 @@ class PersonList:
                                                      'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                                      'Observation source', 'Location in Observation Source',
                                                      'Reconstruction Source', 'Location in Reconstruction Source', 'Comment'])
-            locationRelationFrame.to_csv('locationRelations.csv', encoding="UTF-8")
+            self._write_frame(locationRelationFrame, 'locationRelations.csv', directory, append, encoding="UTF-8")
 
         if makeRelations:
             relationsFrame = []
@@ -595,7 +925,7 @@ class PersonList:
                                                'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                                'Observation source', 'Location in Observation Source',
                                                'Reconstruction Source', 'Location in Reconstruction Source', 'Comment'])     
-            relationsFrame.to_csv('relations.csv', encoding="UTF-8")
+            self._write_frame(relationsFrame, 'relations.csv', directory, append, encoding="UTF-8")
 
         if makeEvents:
             eventsFrame = []
@@ -609,7 +939,7 @@ class PersonList:
                         self._format_value(e.event),
                         self._format_value(e.argument),
                         self._format_value(e.location),
-                        self._format_value(a.location_original),
+                        self._format_value(e.location_original),
                         self._format_value(e.annotationDate),
                         self._format_value(e.startDate),
                         self._format_value(e.endDate),
@@ -630,7 +960,7 @@ class PersonList:
                                              'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max',
                                              'Observation source', 'Location in Observation Source',
                                              'Reconstruction Source', 'Location in Reconstruction Source', 'Comment'])
-            eventsFrame.to_csv('events.csv', encoding="UTF-8")
+            self._write_frame(eventsFrame, 'events.csv', directory, append, encoding="UTF-8")
 
         if makeExternalReferences:
             externalReferencesFrame = []
@@ -646,12 +976,17 @@ class PersonList:
             externalReferencesFrame = pd.DataFrame(externalReferencesFrame, 
                                                 columns=['URI', 'Reconstruction ID', 'External DB Name', 
                                                         'External ID', 'External ID Type'])
-            externalReferencesFrame.to_csv('external_references.csv', encoding="UTF-8")    
+            self._write_frame(externalReferencesFrame, 'external_references.csv', directory, append, encoding="UTF-8")    
         
     def update_db(self, db, makeOverview=True, makeAppellations=True, makeActive_as=True, 
                  makeIdentities=True, makeStatuses=True, makeLocation_relations=True, 
                  makeRelations=True, makeEvents=True, makeExternalReferences=True):
 
+        # Make sure the appellation search index exists before anything is written,
+        # its triggers then keep it up to date with every row merged below
+        if makeAppellations:
+            build_appellation_index(db)
+
         # Create engine
         engine = create_engine(f'sqlite:///{db}')
         metadata = MetaData(f'sqlite:///{db}')
@@ -697,6 +1032,7 @@ class PersonList:
                     new_appellation_sql.URI = p.URI
                     new_appellation_sql.observation_id = a.observation_id
                     new_appellation_sql.reconstruction_id = a.reconstruction_id
+                    new_appellation_sql.original_label = a.original_label
                     new_appellation_sql.appellation = a.appellation
                     new_appellation_sql.appellationType = a.appellationType
                     new_appellation_sql.annotationDate = a.annotationDate
@@ -959,6 +1295,281 @@ class PersonList:
 
         session.flush()
 
+    def update_db_sharded(self, directory, shard_by='observation_source', shards=8, only=None, schema='schema.sql',
+                          workers=None, makeOverview=True, makeAppellations=True, makeActive_as=True,
+                          makeIdentities=True, makeStatuses=True, makeLocation_relations=True,
+                          makeRelations=True, makeEvents=True, makeExternalReferences=True):
+        """
+        Export person data to a directory of shard databases instead of a single one.
+        Every shard is a complete database following the schema, built in parallel worker processes
+        and swapped in at once. A catalog.sqlite in the same directory lists the shards; open it with
+        connect_catalog to query all shards as one database.
+
+        With shard_by='observation_source' every attribute row goes to the shard of its source, and a person
+        to every shard that has one of its rows; rows without a source (and external references) go to 'unsourced'.
+        With shard_by='uri_hash' persons are spread over a fixed number of shards by a hash of their URI.
+
+        Parameters:
+        - directory: the directory for the shards and the catalog
+        - shard_by: 'observation_source' or 'uri_hash'
+        - shards: the number of shards for 'uri_hash'; more than 10 gives a warning, since SQLite attaches
+          at most 10 databases by default and connect_catalog could not open them all
+        - only: if given, only rebuild the shards of these observation sources (or URI hash shard numbers),
+          the other shards are left alone. Without it all shards are rebuilt and shards that are no longer used are removed.
+          Sources are normalized like the stored values, and a ValueError is raised for one that matches no shard.
+        - schema: the schema to create every shard with
+        - workers: number of worker processes (defaults to the number of CPUs)
+        - makeOverview ... makeExternalReferences: which tables to export, as in update_db
+        """
+
+        flags = _export_flags(locals())
+
+        if shard_by not in ('observation_source', 'uri_hash'):
+            raise ValueError(f"{shard_by} is not a way to shard, use 'observation_source' or 'uri_hash'")
+        if shard_by == 'uri_hash' and shards > 10:
+            warnings.warn(f"{shards} shards is more than the 10 databases SQLite attaches by default, "
+                          "so connect_catalog may not be able to open them all")
+
+        def shard_of(p, a):
+            if shard_by == 'uri_hash':
+                return _shard_of_uri(p.URI, shards)
+            return _shard_of_source(getattr(a, 'observation_source', None))
+
+        tables = [table for table, (flag, _, _) in DB_EXPORT_TABLES.items() if flags[flag]]
+
+        with open(schema, encoding='utf-8') as f:
+            schema_sql = f.read()
+
+        con = sqlite3.connect(':memory:')
+        try:
+            con.executescript(schema_sql)
+            columns = _export_columns(con, tables)
+        finally:
+            con.close()
+
+        #sort every row into its shard
+        shard_keys = {}
+        shard_rows = {}
+        for p in self.persons:
+            person_shards = set()
+            for table in tables:
+                attribute_name = DB_EXPORT_TABLES[table][1]
+                if attribute_name is None:
+                    continue
+                for a in getattr(p, attribute_name):
+                    name, shard_keys[name] = shard_of(p, a)
+                    person_shards.add(name)
+                    row = tuple(p.URI if c == 'URI' else getattr(a, c) for c in columns[table])
+                    shard_rows.setdefault(name, {}).setdefault(table, []).append(row)
+
+            if 'persons' in tables:
+                if not person_shards:
+                    name, shard_keys[name] = shard_of(p, None)
+                    person_shards.add(name)
+                row = tuple(getattr(p, c) for c in columns['persons'])
+                for name in person_shards:
+                    shard_rows.setdefault(name, {}).setdefault('persons', []).append(row)
+
+        os.makedirs(directory, exist_ok=True)
+        catalog_path = os.path.join(directory, 'catalog.sqlite')
+
+        if only is not None:
+            #the keys are normalized observation_source values, so normalize what was asked for the same way
+            wanted = {str(normalize_string(key)) for key in only}
+            known = {str(key) for key in shard_keys.values()}
+            if os.path.exists(catalog_path):
+                con = sqlite3.connect(catalog_path)
+                try:
+                    con.execute(CATALOG_SQL)
+                    known.update(str(key) for (key,) in con.execute('SELECT key FROM shards'))
+                finally:
+                    con.close()
+            missing = sorted(wanted - known)
+            if missing:
+                raise ValueError(f"{', '.join(missing)} did not match any shard")
+            shard_rows = {name: rows for name, rows in shard_rows.items() if str(shard_keys[name]) in wanted}
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for name, rows in shard_rows.items():
+                shard_tables = {table: (columns[table], rows.get(table, [])) for table in tables}
+                path = os.path.join(directory, f'{name}.sqlite')
+                futures[executor.submit(_write_shard, path, schema_sql, shard_tables)] = name
+
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                future.result()
+
+        con = sqlite3.connect(catalog_path)
+        try:
+            with con:
+                con.execute(CATALOG_SQL)
+                #remove the shards that were rebuilt but have no rows anymore
+                for name, key in con.execute('SELECT name, key FROM shards').fetchall():
+                    if name not in shard_rows and (only is None or str(key) in wanted):
+                        con.execute('DELETE FROM shards WHERE name = ?', (name,))
+                        if os.path.exists(os.path.join(directory, f'{name}.sqlite')):
+                            os.remove(os.path.join(directory, f'{name}.sqlite'))
+                con.executemany(
+                    'INSERT OR REPLACE INTO shards (name, shard_by, key, path) VALUES (?, ?, ?, ?)',
+                    [(name, shard_by, shard_keys[name], f'{name}.sqlite') for name in shard_rows]
+                )
+            count = con.execute('SELECT COUNT(*) FROM shards').fetchone()[0]
+        finally:
+            con.close()
+
+        #the number of observation_source shards depends on the data, so it can only be checked afterwards
+        if shard_by == 'observation_source' and count > 10:
+            warnings.warn(f"The catalog has {count} shards, more than the 10 databases SQLite attaches by default, "
+                          "so connect_catalog may not be able to open them all")
+
+    def to_linked_data(self, path: str, format: str = 'nt', vocab: str = 'urn:glob-persons:'):
+        """Write the persons as N-Triples or JSON-LD lines, see export_linked_data."""
+        return export_linked_data(self.persons, path, format, vocab)
+
+    def diff(self, new: 'PersonList') -> 'PersonListChangeset':
+        """Compare this PersonList with a newer version of it, see diff_person_lists."""
+        return diff_person_lists(self, new)
+
+    def crosswalk(self) -> 'CrosswalkIndex':
+        """Build a CrosswalkIndex from the external references of all persons."""
+        return CrosswalkIndex.from_persons(self.persons)
+
+    def to_columnar(self) -> 'ColumnarPersonList':
+        """Copy the persons into a ColumnarPersonList, for bulk operations on columns."""
+        return ColumnarPersonList.from_person_list(self)
+
+    def to_csv_concurrent(self, makeOverview=True, makeAppellations=True, makeActive_as=True, makeIdentities=True,
+                          makeStatuses=True, makeLocation_relations=True, makeRelations=True, makeEvents=True,
+                          makeExternalReferences=True, directory='.', append=False, workers: int = 4,
+                          compression: Optional[str] = None, batch_size: int = 5000, queue_size: int = 4) -> dict:
+        """
+        Export to the same CSV files as to_csv, with a pool of threads writing all files at once, see write_csv_concurrent.
+        Returns the throughput report of write_csv_concurrent.
+        """
+        make = _export_flags(locals())
+        files = [filename for filename in CSV_COLUMNS if make[CSV_FLAGS[filename]]]
+        return write_csv_concurrent(self.persons, directory, files, workers, compression, batch_size, queue_size, append)
+
+    def timeline(self, attributes: Optional[dict] = None) -> 'Timeline':
+        """The dated careers of all persons, sorted, with their gaps and conflicts, see Timeline."""
+        return self.to_columnar().timeline(attributes)
+
+    def profile(self, vocabulary: Optional[dict] = None) -> 'VocabularyProfile':
+        """Count the values of all Person lists in one walk, see VocabularyProfile."""
+        return VocabularyProfile(vocabulary).add(self.persons)
+
+    def _db_rows(self, table, columns):
+        """Collect the rows of one database table as tuples, in the order of columns."""
+        attribute_name = DB_EXPORT_TABLES[table][1]
+
+        if attribute_name is None:
+            return [tuple(getattr(p, c) for c in columns) for p in self.persons]
+
+        #the URI always comes from the person, like in update_db
+        return [
+            tuple(p.URI if c == 'URI' else getattr(a, c) for c in columns)
+            for p in self.persons
+            for a in getattr(p, attribute_name)
+        ]
+
+    def update_db_staged(self, db, workers=None, staging_dir=None, makeOverview=True, makeAppellations=True,
+                         makeActive_as=True, makeIdentities=True, makeStatuses=True, makeLocation_relations=True,
+                         makeRelations=True, makeEvents=True, makeExternalReferences=True):
+        """
+        Export person data to the database like update_db, but in two stages.
+        First every table is written to its own staging SQLite file by a pool of worker processes.
+        Then all staging files are attached to the target database and copied in with
+        INSERT ... SELECT in a single transaction, so the target is either fully updated or untouched.
+
+        Finished staging files are kept until the merge succeeds. Calling this method again with the same
+        database and persons resumes the export: tables that were already staged are not written again.
+        The rows are built in the worker processes, which also hash them: the manifest keeps a hash of the rows
+        of every staged table, so a staging file is only reused when it holds exactly the rows that would be written now.
+        Every merge is recorded in a staged_merges table in the target, in the same transaction,
+        so a run that crashed after its merge was committed does not merge the same rows again.
+
+        Parameters:
+        - db: path to the SQLite database
+        - workers: number of worker processes (defaults to the number of CPUs)
+        - staging_dir: directory for the staging files (defaults to '<db>.staging')
+        - makeOverview ... makeExternalReferences: which tables to export, as in update_db
+
+        Raises:
+            sqlite3.OperationalError: if the merge fails; the target is rolled back and the staging files are kept
+        """
+
+        flags = _export_flags(locals())
+        tables = [table for table, (flag, _, _) in DB_EXPORT_TABLES.items() if flags[flag]]
+
+        if staging_dir is None:
+            staging_dir = f'{db}.staging'
+        os.makedirs(staging_dir, exist_ok=True)
+
+        #staging files of an earlier, different or already merged export cannot be reused
+        manifest_path = os.path.join(staging_dir, 'manifest.json')
+        fingerprint = {'db': os.path.abspath(db), 'tables': tables}
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        if manifest.get('fingerprint') != fingerprint or manifest.get('merged') or 'run' not in manifest:
+            _clear_staging_dir(staging_dir)
+            manifest = {'fingerprint': fingerprint, 'merged': False, 'hashes': {}, 'run': os.urandom(8).hex()}
+            _write_manifest(manifest_path, manifest)
+        hashes = manifest['hashes']
+
+        if makeAppellations:
+            build_appellation_index(db)
+
+        con = sqlite3.connect(db)
+        try:
+            target_columns = _export_columns(con, tables)
+        finally:
+            con.close()
+
+        staging_paths = {table: os.path.join(staging_dir, f'{table}.sqlite') for table in tables}
+
+        #the workers get the persons once and build, hash and write the rows of their tables themselves
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_staging_worker, initargs=(self.persons,)) as executor:
+            futures = {
+                executor.submit(_stage_table, staging_paths[table], table, target_columns[table], hashes.get(table)): table
+                for table in tables
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                hashes[futures[future]] = future.result()
+                _write_manifest(manifest_path, manifest)
+
+        #identifies this staged content in the target, so a merge that committed is never repeated
+        merge_key = f"{manifest['run']}:{_rows_hash(tables, [hashes[table] for table in tables])}"
+
+        con = sqlite3.connect(db, isolation_level=None)
+        try:
+            for i, table in enumerate(tables):
+                con.execute(f'ATTACH DATABASE ? AS stage_{i}', (staging_paths[table],))
+
+            con.execute('BEGIN')
+            try:
+                #the merge is recorded in the same transaction, so a crash after the commit cannot merge it twice
+                con.execute(STAGED_MERGES_SQL)
+                merged = con.execute('SELECT 1 FROM "staged_merges" WHERE merge_key = ?', (merge_key,)).fetchone()
+                if not merged:
+                    for i, table in enumerate(tables):
+                        columns = ', '.join(f'"{row[1]}"' for row in con.execute(f'PRAGMA stage_{i}.table_info("rows")'))
+                        con.execute(f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM stage_{i}."rows"')
+                    con.execute('INSERT INTO "staged_merges" (merge_key, merged_at) VALUES (?, ?)',
+                                (merge_key, datetime.now().isoformat(timespec='seconds')))
+                con.execute('COMMIT')
+            except sqlite3.OperationalError:
+                con.execute('ROLLBACK')  # Roll back the transaction on error, the staging files stay for a retry
+                raise
+        finally:
+            con.close()
+
+        manifest['merged'] = True
+        _write_manifest(manifest_path, manifest)
+        _clear_staging_dir(staging_dir)
+        os.rmdir(staging_dir)
+
 
 # In[17]:
 
@@ -970,7 +1581,9 @@ def import_linking_list(filename):
     # Read the CSV into a DataFrame
     df = pd.read_csv(filename)
     # Convert the DataFrame into a dictionary
-    result = dict(zip(df['original_label'].str.strip().str.lower(), df['URI']))
+    #rows without a URI (e.g. not yet filled in) are left out, instead of linking to an empty value
+    df = df.dropna(subset=['URI'])
+    result = dict(zip(df['original_label'].str.strip().map(_normalize), df['URI']))
 
     return result
 
@@ -978,5 +1591,2836 @@ def import_linking_list(filename):
 # In[ ]:
 
 
+APPELLATION_INDEX_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS appellations_fts USING fts5(
+        appellation,
+        original_label,
+        toponym,
+        content='appellations',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS appellations_fts_insert AFTER INSERT ON appellations BEGIN
+        INSERT INTO appellations_fts(rowid, appellation, original_label, toponym)
+        VALUES (new.id, new.appellation, new.original_label, new.toponym);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS appellations_fts_delete AFTER DELETE ON appellations BEGIN
+        INSERT INTO appellations_fts(appellations_fts, rowid, appellation, original_label, toponym)
+        VALUES ('delete', old.id, old.appellation, old.original_label, old.toponym);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS appellations_fts_update AFTER UPDATE ON appellations BEGIN
+        INSERT INTO appellations_fts(appellations_fts, rowid, appellation, original_label, toponym)
+        VALUES ('delete', old.id, old.appellation, old.original_label, old.toponym);
+        INSERT INTO appellations_fts(rowid, appellation, original_label, toponym)
+        VALUES (new.id, new.appellation, new.original_label, new.toponym);
+    END""",
+]
+
+
+def build_appellation_index(db):
+    """
+    Makes sure the full-text index over appellation, original_label and toponym exists in the database.
+    The index is filled once when it is created; after that the triggers update it row by row
+    whenever appellations are inserted, updated or deleted, so it never needs a full rebuild.
+    Databases created before the index existed get the missing original_label column added.
+
+    Args:
+        db: path to the SQLite database
+    """
+    con = sqlite3.connect(db)
+    try:
+        with con:
+            columns = [row[1] for row in con.execute('PRAGMA table_info("appellations")')]
+
+            #nothing to index if the schema has not been loaded yet
+            if not columns:
+                return
+
+            if 'original_label' not in columns:
+                con.execute('ALTER TABLE "appellations" ADD COLUMN "original_label" TEXT')
+
+            exists = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'appellations_fts'").fetchone()
+
+            for statement in APPELLATION_INDEX_SQL:
+                con.execute(statement)
+
+            #index the rows that were already there
+            if not exists:
+                con.execute("INSERT INTO appellations_fts(appellations_fts) VALUES('rebuild')")
+    finally:
+        con.close()
+
+
+def search_persons(db, query: str, limit: int = 25):
+    """
+    Searches the appellation index for persons matching a name.
+    Every word in the query is matched as the start of a word in appellation, original_label
+    or toponym, ignoring case and diacritics ("coen" finds "Coën", "pieter" finds "Pietersz").
+
+    Args:
+        db: path to the SQLite database
+        query: the name (or part of it) to search for
+        limit: maximum number of persons to return
+
+    Returns:
+        list: (URI, score, matched appellations) tuples, best match first
+    """
+
+    con = sqlite3.connect(db)
+    try:
+        return _appellation_matches(con, query, limit)
+    finally:
+        con.close()
+
+
+def _appellation_matches(con, query: str, limit: int):
+    """The search of search_persons on an open connection."""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+
+    match = ' '.join(f'"{term}"*' for term in terms)
+
+    #bm25 is lower for better matches, so the best row of every person comes first
+    rows = con.execute(
+        """
+        SELECT a.URI, hits.score, a.appellation
+        FROM (
+            SELECT rowid, bm25(appellations_fts) AS score
+            FROM appellations_fts
+            WHERE appellations_fts MATCH ?
+        ) AS hits
+        JOIN appellations a ON a.id = hits.rowid
+        ORDER BY hits.score
+        """,
+        (match,)
+    )
+
+    results = {}
+    for uri, score, appellation in rows:
+        if uri not in results:
+            if len(results) == limit:
+                break
+            results[uri] = (uri, -score, [])
+        if appellation is not None and appellation not in results[uri][2]:
+            results[uri][2].append(appellation)
+
+    return list(results.values())
+
+
+# In[ ]:
+
+
+_DATE_COLUMNS = ['annotationDate', 'startDate', 'endDate', 'startDate_min', 'startDate_max', 'endDate_min', 'endDate_max']
+_SOURCE_COLUMNS = ['observation_source', 'location_in_observation_source', 'reconstruction_source',
+                   'location_in_reconstruction_source', 'comment']
+
+# table: (update_db flag, Person attribute or None for the person itself, columns written by update_db)
+DB_EXPORT_TABLES = {
+    'persons': ('makeOverview', None, ['URI', 'rdfs_label', 'comment']),
+    'appellations': ('makeAppellations', 'appellations',
+                     ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'appellation', 'appellationType']
+                     + _DATE_COLUMNS + ['toponym', 'toponym_location'] + _SOURCE_COLUMNS),
+    'activeAs': ('makeActive_as', 'active_as',
+                 ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'activity', 'activityType',
+                  'employer', 'employer_organization'] + _DATE_COLUMNS + ['location', 'location_original'] + _SOURCE_COLUMNS),
+    'identities': ('makeIdentities', 'identities',
+                   ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'identity', 'identityType']
+                   + _DATE_COLUMNS + ['location', 'location_original'] + _SOURCE_COLUMNS),
+    'statuses': ('makeStatuses', 'statuses',
+                 ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'status', 'statusType']
+                 + _DATE_COLUMNS + ['location', 'location_original'] + _SOURCE_COLUMNS),
+    'locationRelations': ('makeLocation_relations', 'location_relations',
+                          ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'locationRelation']
+                          + _DATE_COLUMNS + ['location', 'location_original'] + _SOURCE_COLUMNS),
+    'relations': ('makeRelations', 'relations',
+                  ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'relation', 'otherPerson']
+                  + _DATE_COLUMNS + _SOURCE_COLUMNS),
+    'events': ('makeEvents', 'events',
+               ['URI', 'observation_id', 'reconstruction_id', 'original_label', 'event', 'argument']
+               + _DATE_COLUMNS + ['location', 'location_original'] + _SOURCE_COLUMNS),
+    'externalReferences': ('makeExternalReferences', 'external_references',
+                           ['URI', 'reconstruction_id', 'external_db_name', 'external_id', 'external_id_type']),
+}
+
+# the make... flags of the export methods, in the order of DB_EXPORT_TABLES
+EXPORT_FLAGS = [flag for flag, _, _ in DB_EXPORT_TABLES.values()]
+
+
+def _export_flags(arguments: dict) -> dict:
+    """The make... flags of an export method, taken from its locals()."""
+    return {flag: arguments[flag] for flag in EXPORT_FLAGS}
+
+
+def _export_columns(con, tables) -> dict:
+    """Per table, the columns of DB_EXPORT_TABLES that exist in the database, the same ones update_db ends up writing."""
+    columns = {}
+    for table in tables:
+        existing = {row[1] for row in con.execute(f'PRAGMA table_info("{table}")')}
+        columns[table] = [c for c in DB_EXPORT_TABLES[table][2] if c in existing]
+    return columns
+
+
+def _write_staging_table(path, columns, rows):
+    """
+    Worker for update_db_staged: writes the rows of one table to a staging SQLite file.
+    The file is written under a temporary name and only renamed when complete,
+    so an existing staging file always holds a finished table.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    column_list = ', '.join(f'"{c}"' for c in columns)
+    placeholders = ', '.join('?' for _ in columns)
+
+    con = sqlite3.connect(tmp_path)
+    try:
+        with con:
+            con.execute(f'CREATE TABLE "rows" ({column_list})')
+            con.executemany(f'INSERT INTO "rows" VALUES ({placeholders})', rows)
+    finally:
+        con.close()
+
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+STAGED_MERGES_SQL = """CREATE TABLE IF NOT EXISTS "staged_merges" (
+    "merge_key" TEXT PRIMARY KEY,
+    "merged_at" TEXT
+)"""
+
+#the persons of update_db_staged in a worker process, set once per worker by _init_staging_worker
+_staging_persons = None
+
+
+def _init_staging_worker(persons):
+    global _staging_persons
+    _staging_persons = PersonList(persons)
+
+
+def _stage_table(path, table, columns, staged_hash):
+    """
+    Worker for update_db_staged: builds the rows of one table and writes them to a staging file,
+    unless the file already holds exactly these rows (staged_hash).
+
+    Returns:
+        str: the hash of the rows, to store in the manifest
+    """
+    rows = _staging_persons._db_rows(table, columns)
+    rows_hash = _rows_hash(columns, rows)
+    #a staging file of other persons (or of an interrupted write) is staged again
+    if not (os.path.exists(path) and staged_hash == rows_hash):
+        _write_staging_table(path, columns, rows)
+    return rows_hash
+
+
+def _rows_hash(columns, rows) -> str:
+    """A hash of the columns and rows of one staged table, to tell whether a staging file can be reused."""
+    h = hashlib.blake2b(repr(columns).encode('utf-8'), digest_size=16)
+    for row in rows:
+        h.update(repr(row).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _write_manifest(path, manifest):
+    """Write the manifest of update_db_staged under a temporary name first, so it is never left half written."""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _clear_staging_dir(staging_dir):
+    """Remove the staging files and manifest written by update_db_staged."""
+    for name in os.listdir(staging_dir):
+        if name.endswith(('.sqlite', '.sqlite.tmp')) or name in ('manifest.json', 'manifest.json.tmp'):
+            os.remove(os.path.join(staging_dir, name))
+
+
+# In[ ]:
+
+
+@dataclass
+class PersonListPipeline:
+    """
+    Declares split, link, lowercase and date expansion steps up front and applies them to a PersonList in one pass.
+    Every attribute list of every person is fetched once and goes through all of its steps in the order
+    they were declared, which gives the same result as calling split_list_values, link_list_values,
+    lowercase_list_values and expand_list_dates one after another.
+
+    Example:
+        pipeline = (PersonListPipeline()
+                    .split('active_as', 'location', [',', ';'], [''], [])
+                    .link(locations, 'active_as', 'location')
+                    .expand_dates('active_as', 'startDate'))
+        stats = pipeline.run(person_list)
+    """
+    steps: List[tuple] = field(default_factory=list)
+
+    def split(self, attribute_name: str, field_name: str, separators: List[str], unused_remains: List[str], exceptions: List[str]):
+        """Add a step that works like split_list_values."""
+        self.steps.append(('split', attribute_name, field_name, (separators, set(unused_remains), set(exceptions))))
+        return self
+
+    def link(self, mapping: dict, attribute_name: str, field_name: str, log_file: str = "unmatched_values.txt"):
+        """Add a step that works like link_list_values. Unmatched values are logged once per run instead of once per person."""
+        self.steps.append(('link', attribute_name, field_name, (mapping, log_file)))
+        return self
+
+    def lowercase(self, attribute_name: str, field_name: str):
+        """Add a step that works like lowercase_list_values."""
+        self.steps.append(('lowercase', attribute_name, field_name, ()))
+        return self
+
+    def expand_dates(self, attribute_name: str, field_name: str):
+        """Add a step that works like expand_list_dates."""
+        self.steps.append(('expand_dates', attribute_name, field_name, ()))
+        return self
+
+    def _compile(self):
+        """Check every step once and group the steps per attribute, keeping their order."""
+        person_fields = {f.name: f.type for f in fields(Person)}
+        compiled = {}
+
+        for index, (kind, attribute_name, field_name, args) in enumerate(self.steps):
+            attribute_type = person_fields.get(attribute_name)
+            if getattr(attribute_type, '__origin__', None) is not list:
+                raise AttributeError(f"{attribute_name} is not a valid Person Attribute")
+
+            if field_name not in {f.name for f in fields(attribute_type.__args__[0])}:
+                raise AttributeError(f"{field_name} is not a valid field for {attribute_name}")
+
+            if kind == 'expand_dates' and field_name not in ('startDate', 'endDate'):
+                raise AttributeError(f"{field_name} is not a date field with bounds, use startDate or endDate")
+
+            compiled.setdefault(attribute_name, []).append((index, kind, field_name, args))
+
+        return compiled
+
+    def run(self, person_list: PersonList) -> pd.DataFrame:
+        """
+        Apply all steps to the persons in the list.
+
+        Args:
+            person_list: the PersonList to transform, in place
+
+        Returns:
+            pd.DataFrame: one row per step with the rows that went in and came out,
+            the number of rows it changed (for split: the rows that were split) and the distinct unmatched values for link steps
+        """
+        compiled = self._compile()
+
+        stats = [
+            {'step': kind, 'attribute': attribute_name, 'field': field_name, 'rows_in': 0, 'rows_out': 0, 'changed': 0, 'unmatched': 0}
+            for kind, attribute_name, field_name, _ in self.steps
+        ]
+        unmatched = [set() for _ in self.steps]
+
+        for p in person_list.persons:
+            for attribute_name, steps in compiled.items():
+                attr_list = getattr(p, attribute_name)
+                if not attr_list:
+                    continue
+
+                for index, kind, field_name, args in steps:
+                    stat = stats[index]
+                    stat['rows_in'] += len(attr_list)
+
+                    if kind == 'split':
+                        new_attrs = []
+                        for a in attr_list:
+                            parts = Person._split_attribute(a, field_name, *args)
+                            stat['changed'] += len(parts) > 1
+                            new_attrs.extend(parts)
+                        attr_list = new_attrs
+                    elif kind == 'link':
+                        for a in attr_list:
+                            stat['changed'] += Person._link_attribute(a, args[0], field_name, unmatched[index])
+                    elif kind == 'lowercase':
+                        for a in attr_list:
+                            stat['changed'] += Person._lowercase_attribute(a, field_name)
+                    elif kind == 'expand_dates':
+                        for a in attr_list:
+                            stat['changed'] += Person._expand_attribute_date(a, field_name)
+
+                    stat['rows_out'] += len(attr_list)
+
+                setattr(p, attribute_name, attr_list)
+
+        for index, (kind, _, _, args) in enumerate(self.steps):
+            if kind == 'link' and unmatched[index]:
+                stats[index]['unmatched'] = len(unmatched[index])
+                with open(args[1], "a", encoding="utf-8") as f:
+                    for val in unmatched[index]:
+                        f.write(f"{val}\n")
+
+        return pd.DataFrame(stats)
+
+
+# In[ ]:
+
+
+# file written by to_csv: (Person attribute, class of its instances), None for the overview
+CSV_FILES = {
+    'overview.csv': None,
+    'appellations.csv': ('appellations', Appellation),
+    'activities.csv': ('active_as', ActiveAs),
+    'identities.csv': ('identities', Identity),
+    'statuses.csv': ('statuses', Status),
+    'locationRelations.csv': ('location_relations', LocationRelation),
+    'relations.csv': ('relations', Relation),
+    'events.csv': ('events', Event),
+    'external_references.csv': ('external_references', ExternalReference),
+}
+
+# column headers written by to_csv and the fields they come from
+CSV_HEADERS = {
+    'URI': 'URI', 'rdfs:label': 'rdfs_label', 'Comment': 'comment',
+    'Observation': 'observation_id', 'Reconstruction': 'reconstruction_id', 'Reconstruction ID': 'reconstruction_id',
+    'Original Label': 'original_label', 'AnnotationDate': 'annotationDate', 'StartDate': 'startDate', 'EndDate': 'endDate',
+    'StartDate_Min': 'startDate_min', 'StartDate_Max': 'startDate_max', 'EndDate_Min': 'endDate_min', 'EndDate_Max': 'endDate_max',
+    'Observation source': 'observation_source', 'Location in Observation Source': 'location_in_observation_source',
+    'Reconstruction Source': 'reconstruction_source', 'Location in Reconstruction Source': 'location_in_reconstruction_source',
+    'Location': 'location', 'Original_Location_Description': 'location_original',
+    'Appellation': 'appellation', 'AppellationType': 'appellationType', 'Toponym': 'toponym', 'Toponym_Location': 'toponym_location',
+    'Activity': 'activity', 'ActivityType': 'activityType', 'Employer': 'employer', 'Employer_Organization': 'employer_organization',
+    'Identity': 'identity', 'IdentityType': 'identityType', 'Status': 'status', 'StatusType': 'statusType',
+    'LocationRelation': 'locationRelation', 'Relation': 'relation', 'OtherPerson': 'otherPerson',
+    'Event': 'event', 'Argument': 'argument',
+    'External DB Name': 'external_db_name', 'External ID': 'external_id', 'External ID Type': 'external_id_type',
+}
+
+
+class _CsvRowReader:
+    """Reads one CSV written by to_csv in chunks and hands out the rows of the persons asked for."""
+
+    def __init__(self, path, chunk_size):
+        self.chunks = pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False, na_values=['-1', ''],
+                                  chunksize=chunk_size)
+        self.pending = None
+
+    def take(self, uris: set) -> pd.DataFrame:
+        """Return the rows at the front of the file that belong to one of the URIs."""
+        taken = []
+        while True:
+            if self.pending is None or self.pending.empty:
+                self.pending = next(self.chunks, None)
+                if self.pending is None:
+                    break
+
+            #the rows of a person are contiguous and in the order of the overview, so stop at the first other URI
+            in_chunk = self.pending['URI'].isin(uris).to_numpy()
+            stop = len(in_chunk) if in_chunk.all() else int(in_chunk.argmin())
+            taken.append(self.pending.iloc[:stop])
+            self.pending = self.pending.iloc[stop:]
+            if not self.pending.empty:
+                break
+
+        #to_csv numbers the rows per write, so the index of appended files is not unique
+        return pd.concat(taken).reset_index(drop=True) if taken else pd.DataFrame(columns=['URI'])
+
+    def exhausted(self) -> bool:
+        if self.pending is None or self.pending.empty:
+            self.pending = next(self.chunks, None)
+        return self.pending is None
+
+
+def stream_csv_persons(directory='.', chunk_size: int = 10000, quarantine_file: Optional[str] = None):
+    """
+    Reads the CSV files written by PersonList.to_csv back in chunks, without loading whole files.
+    Yields a PersonList per chunk of persons from overview.csv, with the rows of the other files attached.
+    overview.csv is required, the other files are skipped when they are missing.
+    The rows of each file must be in the order of overview.csv, which is how to_csv writes them.
+    Rows with invalid dates are quarantined instead of stopping the import, see PersonAttribute.from_frame.
+
+    Args:
+        directory: the directory with overview.csv and the other CSV files
+        chunk_size: the number of persons (and CSV rows read at a time) per chunk
+        quarantine_file: if given, the rows with invalid dates are appended to this CSV file
+
+    Yields:
+        PersonList: the persons of one chunk
+
+    Raises:
+        FileNotFoundError: if the directory has no overview.csv
+    """
+    overview_path = os.path.join(directory, 'overview.csv')
+    if not os.path.exists(overview_path):
+        raise FileNotFoundError(f"{overview_path} is required to read persons from CSV files")
+
+    readers = {
+        filename: _CsvRowReader(os.path.join(directory, filename), chunk_size)
+        for filename in CSV_FILES
+        if os.path.exists(os.path.join(directory, filename))
+    }
+    overview = readers.pop('overview.csv')
+
+    while not overview.exhausted():
+        overview_rows = overview.pending.iloc[:chunk_size]
+        overview.pending = overview.pending.iloc[chunk_size:]
+
+        persons = {}
+        for uri, label, comment in overview_rows[['URI', 'rdfs:label', 'Comment']].itertuples(index=False, name=None):
+            p = Person(URI=uri, comment=None if pd.isna(comment) else comment)
+            if not pd.isna(label):
+                p.rdfs_label = label
+            persons.setdefault(uri, p)
+
+        for filename, reader in readers.items():
+            attribute_name, attribute_class = CSV_FILES[filename]
+            frame = reader.take(set(persons)).rename(columns=CSV_HEADERS)
+            if frame.empty:
+                continue
+
+            if attribute_class is ExternalReference:
+                records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+                instances = pd.Series([ExternalReference(**r) for r in records], index=frame.index, dtype=object)
+            else:
+                instances, _ = attribute_class.from_frame(frame, quarantine_file)
+
+            for uri, instance in zip(frame.loc[instances.index, 'URI'], instances):
+                getattr(persons[uri], attribute_name).append(instance)
+
+        yield PersonList(list(persons.values()))
+
+    leftovers = [filename for filename, reader in readers.items() if not reader.exhausted()]
+    if leftovers:
+        raise ValueError(f"{', '.join(leftovers)} contain rows for URIs that are not in overview.csv or not in its order")
+
+
+def ingest_csv(directory='.', chunk_size: int = 10000, pipeline: Optional['PersonListPipeline'] = None,
+               db: Optional[str] = None, csv_directory: Optional[str] = None, quarantine_file: Optional[str] = None):
+    """
+    Streams persons from CSV files through an optional pipeline into a database and/or new CSV files,
+    one chunk at a time, so memory use depends on chunk_size and not on the size of the source.
+
+    Args:
+        directory: the directory with the source CSV files, see stream_csv_persons
+        chunk_size: the number of persons per chunk
+        pipeline: a PersonListPipeline to run on every chunk
+        db: if given, every chunk is written to this database with update_db
+        csv_directory: if given, every chunk is appended to CSV files in this directory with to_csv
+        quarantine_file: if given, the rows with invalid dates are appended to this CSV file
+
+    Returns:
+        pd.DataFrame: the pipeline statistics summed over all chunks, or None without a pipeline
+    """
+    totals = None
+    first = True
+
+    for chunk in stream_csv_persons(directory, chunk_size, quarantine_file):
+        if pipeline is not None:
+            stats = pipeline.run(chunk)
+            if totals is None:
+                totals = stats
+            else:
+                counts = ['rows_in', 'rows_out', 'changed', 'unmatched']
+                totals[counts] += stats[counts]
+
+        if db is not None:
+            chunk.update_db(db)
+
+        if csv_directory is not None:
+            chunk.to_csv(directory=csv_directory, append=not first)
+
+        first = False
+
+    return totals
+
+
+# In[ ]:
+
+
+PERSON_ATTRIBUTES = ['appellations', 'active_as', 'identities', 'statuses', 'location_relations',
+                     'relations', 'events', 'external_references']
+
+_row_getters = {}
+
+
+def _row_digest(row) -> bytes:
+    """Content hash of one attribute row, over all its fields except the database id."""
+    getter = _row_getters.get(type(row))
+    if getter is None:
+        getter = _row_getters[type(row)] = attrgetter(*[f.name for f in fields(row) if f.name != 'id'])
+    return hashlib.blake2b(repr(getter(row)).encode('utf-8'), digest_size=16).digest()
+
+
+def _row_key(row):
+    """The identity of a row across versions: its observation/reconstruction id, or the external id. None if it has none."""
+    if isinstance(row, ExternalReference):
+        key = (row.external_db_name, row.external_id)
+    else:
+        key = (row.observation_id, row.reconstruction_id)
+    return None if key == (None, None) else key
+
+
+def _person_digests(p: Person):
+    """Content hash of a person and the sorted row hashes per attribute, so the order of the rows does not matter."""
+    row_digests = {name: sorted(_row_digest(row) for row in getattr(p, name)) for name in PERSON_ATTRIBUTES}
+    h = hashlib.blake2b(repr((p.URI, p.rdfs_label, p.comment)).encode('utf-8'), digest_size=16)
+    for name in PERSON_ATTRIBUTES:
+        h.update(b''.join(row_digests[name]) + b'|')
+    return h.digest(), row_digests
+
+
+def _persons_by_uri(person_list: PersonList) -> dict:
+    persons = {}
+    for p in person_list.persons:
+        if p.URI in persons:
+            raise ValueError(f"URI {p.URI} occurs more than once, persons can only be compared by unique URIs")
+        persons[p.URI] = p
+    return persons
+
+
+@dataclass
+class PersonListChangeset:
+    """
+    The differences between two versions of a PersonList, as made by PersonList.diff.
+    Rows are (URI, attribute name, row) tuples; changed rows keep the old row to find it again when the changes are applied.
+    """
+    added_persons: List[Person] = field(default_factory=list)
+    removed_persons: List[str] = field(default_factory=list)
+    updated_persons: List[Tuple[str, dict]] = field(default_factory=list)
+    added_rows: List[tuple] = field(default_factory=list)
+    removed_rows: List[tuple] = field(default_factory=list)
+    changed_rows: List[tuple] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        """The number of changes of each kind."""
+        return {f.name: len(getattr(self, f.name)) for f in fields(self)}
+
+    def apply(self, person_list: PersonList):
+        """
+        Apply the changes to a PersonList in place, e.g. the old version it was made from or a copy of it.
+        Rows are found by their content, so the list does not have to hold the same objects.
+        """
+        removed = set(self.removed_persons)
+        person_list.persons = [p for p in person_list.persons if p.URI not in removed]
+        persons = _persons_by_uri(person_list)
+
+        for uri, values in self.updated_persons:
+            for name, value in values.items():
+                setattr(persons[uri], name, value)
+
+        for uri, attribute_name, old_row in self.removed_rows:
+            attr_list = getattr(persons[uri], attribute_name)
+            attr_list.pop(self._find_row(attr_list, old_row))
+
+        for uri, attribute_name, old_row, new_row in self.changed_rows:
+            attr_list = getattr(persons[uri], attribute_name)
+            attr_list[self._find_row(attr_list, old_row)] = new_row
+
+        for uri, attribute_name, new_row in self.added_rows:
+            getattr(persons[uri], attribute_name).append(new_row)
+
+        person_list.persons.extend(self.added_persons)
+
+    @staticmethod
+    def _find_row(attr_list, old_row) -> int:
+        digest = _row_digest(old_row)
+        for index, row in enumerate(attr_list):
+            if row is old_row or _row_digest(row) == digest:
+                return index
+        raise ValueError(f"Row {old_row} is not in the person list, the changeset was made from another version")
+
+    def apply_to_db(self, db):
+        """
+        Apply the changes to a database filled by update_db from the old version, in a single transaction.
+        Rows are matched on the URI and all exported columns of the old row.
+
+        Args:
+            db: path to the SQLite database
+
+        Raises:
+            sqlite3.OperationalError: if a change cannot be applied; the database is rolled back
+        """
+        build_appellation_index(db)
+
+        table_of = {attribute_name: table for table, (_, attribute_name, _) in DB_EXPORT_TABLES.items()}
+
+        con = sqlite3.connect(db, isolation_level=None)
+        try:
+            columns = _export_columns(con, DB_EXPORT_TABLES)
+
+            def values(uri, row, table):
+                return [uri if c == 'URI' else getattr(row, c) for c in columns[table]]
+
+            def insert(table, row_values):
+                column_list = ', '.join(f'"{c}"' for c in columns[table])
+                placeholders = ', '.join('?' for _ in columns[table])
+                con.execute(f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})', row_values)
+
+            def matching_id(table, uri, row):
+                condition = ' AND '.join(f'"{c}" IS ?' for c in columns[table])
+                return f'(SELECT id FROM "{table}" WHERE {condition} LIMIT 1)', values(uri, row, table)
+
+            con.execute('BEGIN')
+            try:
+                for uri in self.removed_persons:
+                    for table in DB_EXPORT_TABLES:
+                        con.execute(f'DELETE FROM "{table}" WHERE URI = ?', (uri,))
+
+                for uri, updated in self.updated_persons:
+                    updated = {name: value for name, value in updated.items() if name in columns['persons']}
+                    if updated:
+                        assignments = ', '.join(f'"{name}" = ?' for name in updated)
+                        con.execute(f'UPDATE persons SET {assignments} WHERE URI = ?', list(updated.values()) + [uri])
+
+                for uri, attribute_name, old_row in self.removed_rows:
+                    table = table_of[attribute_name]
+                    match, params = matching_id(table, uri, old_row)
+                    con.execute(f'DELETE FROM "{table}" WHERE id = {match}', params)
+
+                for uri, attribute_name, old_row, new_row in self.changed_rows:
+                    table = table_of[attribute_name]
+                    match, params = matching_id(table, uri, old_row)
+                    assignments = ', '.join(f'"{c}" = ?' for c in columns[table])
+                    con.execute(f'UPDATE "{table}" SET {assignments} WHERE id = {match}', values(uri, new_row, table) + params)
+
+                for uri, attribute_name, new_row in self.added_rows:
+                    table = table_of[attribute_name]
+                    insert(table, values(uri, new_row, table))
+
+                for p in self.added_persons:
+                    insert('persons', values(p.URI, p, 'persons'))
+                    for attribute_name in PERSON_ATTRIBUTES:
+                        table = table_of[attribute_name]
+                        for row in getattr(p, attribute_name):
+                            insert(table, values(p.URI, row, table))
+
+                con.execute('COMMIT')
+            except sqlite3.OperationalError:
+                con.execute('ROLLBACK')  # Roll back the transaction on error
+                raise
+        finally:
+            con.close()
+
+
+def diff_person_lists(old: PersonList, new: PersonList) -> PersonListChangeset:
+    """
+    Compares two versions of a PersonList in linear time.
+    Persons are matched by URI and skipped when their content hash is the same. For the others, rows are matched
+    by observation/reconstruction id (external references by external db and id); rows without ids
+    are matched by content only, so a change to them shows up as a removed and an added row.
+
+    Args:
+        old: the previous version, e.g. the last release
+        new: the revised version
+
+    Returns:
+        PersonListChangeset: the changes that turn old into new
+    """
+    old_persons = _persons_by_uri(old)
+    new_persons = _persons_by_uri(new)
+    changeset = PersonListChangeset()
+
+    changeset.removed_persons = [uri for uri in old_persons if uri not in new_persons]
+
+    for uri, new_p in new_persons.items():
+        old_p = old_persons.get(uri)
+        if old_p is None:
+            changeset.added_persons.append(new_p)
+            continue
+
+        old_digest, old_row_digests = _person_digests(old_p)
+        new_digest, new_row_digests = _person_digests(new_p)
+        if old_digest == new_digest:
+            continue
+
+        updated = {name: getattr(new_p, name) for name in ('rdfs_label', 'comment') if getattr(old_p, name) != getattr(new_p, name)}
+        if updated:
+            changeset.updated_persons.append((uri, updated))
+
+        for attribute_name in PERSON_ATTRIBUTES:
+            if old_row_digests[attribute_name] == new_row_digests[attribute_name]:
+                continue
+            _diff_rows(changeset, uri, attribute_name, getattr(old_p, attribute_name), getattr(new_p, attribute_name))
+
+    return changeset
+
+
+def _diff_rows(changeset: PersonListChangeset, uri: str, attribute_name: str, old_rows: list, new_rows: list):
+    """Add the row changes of one attribute of one person to the changeset."""
+    grouped = {}
+    for side, rows in enumerate((old_rows, new_rows)):
+        for row in rows:
+            grouped.setdefault(_row_key(row), ([], []))[side].append((_row_digest(row), row))
+
+    for key, (olds, news) in grouped.items():
+        #rows that did not change
+        new_digests = {}
+        for digest, row in news:
+            new_digests[digest] = new_digests.get(digest, 0) + 1
+        left_over = []
+        for digest, row in olds:
+            if new_digests.get(digest):
+                new_digests[digest] -= 1
+            else:
+                left_over.append(row)
+        added = []
+        for digest, row in news:
+            if new_digests.get(digest):
+                new_digests[digest] -= 1
+                added.append(row)
+
+        #rows with the same id but other content changed, unless they have no id to pair them by
+        paired = 0 if key is None else min(len(left_over), len(added))
+        for old_row, new_row in zip(left_over[:paired], added[:paired]):
+            changeset.changed_rows.append((uri, attribute_name, old_row, new_row))
+        for old_row in left_over[paired:]:
+            changeset.removed_rows.append((uri, attribute_name, old_row))
+        for new_row in added[paired:]:
+            changeset.added_rows.append((uri, attribute_name, new_row))
+
+
+# In[ ]:
+
+
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+RDFS_LABEL = 'http://www.w3.org/2000/01/rdf-schema#label'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+# values that are linked IRIs are written as IRIs, everything else as literals
+_iri_pattern = re.compile(r'^(https?://|urn:)[^\s<>"{}|^`\\]+$')
+
+
+@lru_cache(maxsize=65536)
+def _is_iri(value) -> bool:
+    return isinstance(value, str) and _iri_pattern.match(value) is not None
+
+
+@lru_cache(maxsize=65536)
+def _nt_term(value, is_date: bool = False) -> str:
+    """The N-Triples form of a field value, cached because vocabulary values repeat a lot."""
+    if _is_iri(value):
+        return f'<{value}>'
+    if is_date:
+        return f'"{_date_literal(value)}"^^<{XSD}{_date_datatype(value)}>'
+    literal = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    return f'"{literal}"'
+
+
+@lru_cache(maxsize=65536)
+def _jsonld_term(value, is_date: bool = False):
+    """The JSON-LD form of a field value."""
+    if _is_iri(value):
+        return {'@id': value}
+    if is_date:
+        return {'@value': _date_literal(value), '@type': f'xsd:{_date_datatype(value)}'}
+    return value
+
+
+def _date_datatype(value: str) -> str:
+    return ('gYear', 'gYearMonth', 'date')[min(value.count('-'), 2)]
+
+
+def _date_literal(value: str) -> str:
+    """Zero-pad month and day, which vali_date allows to be a single digit but XSD does not."""
+    return '-'.join([value.split('-')[0]] + [part.strip().zfill(2) for part in value.split('-')[1:]])
+
+
+@lru_cache(maxsize=None)
+def _linked_data_fields(attribute_class, vocab: str):
+    """(field, predicate IRI, is date) for every exported field of a class, built once per class and vocabulary."""
+    return [
+        (f.name, f'{vocab}{f.name}', f.name in PersonAttribute._date_fields)
+        for f in fields(attribute_class)
+        if f.name not in ('id', 'URI')
+    ]
+
+
+def export_linked_data(persons, path: str, format: str = 'nt', vocab: str = 'urn:glob-persons:'):
+    """
+    Writes persons as linked data, one person at a time, so memory use does not grow with the number of persons.
+    Every person becomes a node of type <vocab>Person; each attribute (appellations, active_as, ...,
+    external_references) becomes a blank node linked to it with <vocab><attribute name> and typed with its class name.
+    Fields are written as <vocab><field name>; values that are IRIs (e.g. linked values, Relation.otherPerson)
+    are written as IRIs, dates as xsd:gYear, xsd:gYearMonth or xsd:date.
+
+    Args:
+        persons: the persons to write, a list or any iterable, e.g. the persons of stream_csv_persons chunks
+        path: the file to write
+        format: 'nt' for N-Triples, or 'jsonld' for one JSON-LD document per person per line
+        vocab: the namespace for classes and properties
+
+    Returns:
+        dict: the number of persons and triples written, the seconds it took and the triples per second
+    """
+    if format not in ('nt', 'jsonld'):
+        raise ValueError(f"{format} is not a supported format, use 'nt' or 'jsonld'")
+
+    rdf_type, rdfs_label = f'<{RDF_TYPE}>', f'<{RDFS_LABEL}>'
+    person_type = f'<{vocab}Person>'
+    context = {'@vocab': vocab, 'rdfs': 'http://www.w3.org/2000/01/rdf-schema#', 'xsd': XSD}
+    links = {name: f'<{vocab}{name}>' for name in PERSON_ATTRIBUTES}
+
+    person_count = 0
+    triple_count = 0
+    blank_node = 0
+    start = time.perf_counter()
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for p in persons:
+            if not _is_iri(p.URI):
+                raise ValueError(f"Person URI {p.URI!r} is not an IRI and cannot be used as a subject")
+
+            subject = f'<{p.URI}>'
+            lines = [f'{subject} {rdf_type} {person_type} .\n']
+            document = {'@context': context, '@id': p.URI, '@type': 'Person'}
+            if p.rdfs_label is not None:
+                lines.append(f'{subject} {rdfs_label} {_nt_term(p.rdfs_label)} .\n')
+                document['rdfs:label'] = p.rdfs_label
+            if p.comment is not None:
+                lines.append(f'{subject} <{vocab}comment> {_nt_term(p.comment)} .\n')
+                document['comment'] = p.comment
+
+            for attribute_name in PERSON_ATTRIBUTES:
+                rows = getattr(p, attribute_name)
+                if not rows:
+                    continue
+
+                nodes = []
+                for row in rows:
+                    blank_node += 1
+                    node = f'_:b{blank_node}'
+                    lines.append(f'{subject} {links[attribute_name]} {node} .\n')
+                    lines.append(f'{node} {rdf_type} <{vocab}{type(row).__name__}> .\n')
+                    values = {'@type': type(row).__name__}
+
+                    for name, predicate, is_date in _linked_data_fields(type(row), vocab):
+                        value = getattr(row, name)
+                        if value is None:
+                            continue
+                        lines.append(f'{node} <{predicate}> {_nt_term(value, is_date)} .\n')
+                        values[name] = _jsonld_term(value, is_date)
+                    nodes.append(values)
+
+                document[attribute_name] = nodes
+
+            triple_count += len(lines)
+            person_count += 1
+            if format == 'nt':
+                f.write(''.join(lines))
+            else:
+                f.write(json.dumps(document, ensure_ascii=False) + '\n')
+
+    seconds = time.perf_counter() - start
+    return {
+        'persons': person_count,
+        'triples': triple_count,
+        'seconds': seconds,
+        'triples_per_second': triple_count / seconds if seconds else float('inf'),
+    }
+
+
+# In[ ]:
+
+
+def _shard_of_source(source):
+    """Shard name and key for an observation_source: readable, and unique thanks to a short hash of the full value."""
+    if source is None:
+        return 'unsourced', None
+    slug = re.sub(r'[^a-z0-9]+', '_', str(source).lower()).strip('_')[:40]
+    return f"source_{slug}_{hashlib.blake2b(str(source).encode('utf-8'), digest_size=4).hexdigest()}", source
+
+
+def _shard_of_uri(uri: str, shards: int):
+    """Shard name and key for a URI hash range, stable across processes unlike hash()."""
+    bucket = int.from_bytes(hashlib.blake2b(uri.encode('utf-8'), digest_size=8).digest(), 'big') % shards
+    return f'uri_{bucket:03d}', bucket
+
+
+def _write_shard(path, schema_sql, tables):
+    """
+    Worker for update_db_sharded: builds one shard database from scratch.
+    The shard is written under a temporary name and then replaces the old file at once,
+    so readers of the other shards, and of this one until the swap, are never blocked.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.executescript(schema_sql)
+        with con:
+            for table, (columns, rows) in tables.items():
+                column_list = ', '.join(f'"{c}"' for c in columns)
+                placeholders = ', '.join('?' for _ in columns)
+                con.executemany(f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})', rows)
+    finally:
+        con.close()
+
+    os.replace(tmp_path, path)
+    return sum(len(rows) for _, rows in tables.values())
+
+
+CATALOG_SQL = """CREATE TABLE IF NOT EXISTS "shards" (
+    "name" TEXT PRIMARY KEY,
+    "shard_by" TEXT,
+    "key" TEXT,
+    "path" TEXT
+)"""
+
+
+def connect_catalog(directory):
+    """
+    Opens the catalog of a sharded export as one logical database.
+    All shards are attached and every table and *_with_ranges view of schema.sql is available under its
+    own name as a UNION ALL over the shards. persons has one row per URI, since a person can appear in several shards:
+    the latest row (highest id) of the shard that was built last.
+    SQLite does not store views over attached databases, so the views are temporary and made for every connection.
+
+    Args:
+        directory: the directory written by update_db_sharded
+
+    Returns:
+        sqlite3.Connection: a connection to query the shards through
+    """
+    con = sqlite3.connect(os.path.join(directory, 'catalog.sqlite'))
+    con.execute(CATALOG_SQL)
+    shards = con.execute('SELECT name, path FROM shards ORDER BY name').fetchall()
+
+    limit = con.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(shards) > limit:
+        con.close()
+        raise ValueError(f"The catalog has {len(shards)} shards but SQLite can attach at most {limit} databases, "
+                         "use fewer URI hash shards or rebuild with fewer observation sources")
+    if not shards:
+        return con
+
+    #attach the shards in the order they were built, so the persons view can prefer the newest one
+    shards.sort(key=lambda shard: os.path.getmtime(os.path.join(directory, shard[1])))
+    for i, (name, path) in enumerate(shards):
+        con.execute(f'ATTACH DATABASE ? AS shard_{i}', (os.path.join(directory, path),))
+
+    objects = con.execute(
+        "SELECT name FROM shard_0.sqlite_master WHERE type IN ('table', 'view') "
+        "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'appellations_fts%'"
+    ).fetchall()
+    for (name,) in objects:
+        if name == 'persons':
+            #take the latest row of a URI in every shard, and of those the one in the shard that was built last
+            union = ' UNION ALL '.join(
+                f'SELECT *, {i} AS shard FROM shard_{i}."persons" '
+                f'WHERE id IN (SELECT MAX(id) FROM shard_{i}."persons" GROUP BY URI)'
+                for i in range(len(shards))
+            )
+            columns = ', '.join(f'"{row[1]}"' for row in con.execute('PRAGMA shard_0.table_info("persons")'))
+            union = (f'SELECT {columns} FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY URI ORDER BY shard DESC) '
+                     f'AS latest FROM ({union})) WHERE latest = 1')
+        else:
+            union = ' UNION ALL '.join(f'SELECT * FROM shard_{i}."{name}"' for i in range(len(shards)))
+        con.execute(f'CREATE TEMP VIEW "{name}" AS {union}')
+
+    return con
+
+# In[ ]:
+
+
+CROSSWALK_SQL = """CREATE TABLE IF NOT EXISTS "crosswalk" (
+    "external_db_name" TEXT,
+    "external_id" TEXT,
+    "external_id_type" TEXT,
+    "URI" TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS "crosswalk_external" ON "crosswalk" ("external_db_name", "external_id", "URI");
+CREATE INDEX IF NOT EXISTS "crosswalk_uri" ON "crosswalk" ("URI");"""
+
+
+def _external_key(external_db_name, external_id):
+    """Key of an external id: ids are compared as stripped strings, so 123 and '123 ' are the same id."""
+    return external_db_name, None if external_id is None else str(external_id).strip()
+
+
+@dataclass
+class CrosswalkIndex:
+    """
+    Two-way index between the persons and their ids in external databases, built from Person.external_references.
+    external maps (external_db_name, external_id) to the URIs of the persons with that id,
+    persons maps a URI to its (external_db_name, external_id) keys and id_types keeps the external_id_type of every key.
+    """
+    external: dict = field(default_factory=dict)
+    persons: dict = field(default_factory=dict)
+    id_types: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_persons(cls, persons) -> 'CrosswalkIndex':
+        """Build the index from an iterable of persons, e.g. PersonList.persons or stream_csv_persons."""
+        index = cls()
+        for p in persons:
+            for reference in p.external_references:
+                index.add(p.URI, reference.external_db_name, reference.external_id, reference.external_id_type)
+        return index
+
+    def add(self, uri: str, external_db_name, external_id, external_id_type=None):
+        """Add one external id of a person. References without an external_id are ignored."""
+        if external_id is None:
+            return
+        key = _external_key(external_db_name, external_id)
+        uris = self.external.setdefault(key, [])
+        if uri not in uris:
+            uris.append(uri)
+            self.persons.setdefault(uri, []).append(key)
+        if external_id_type is not None or key not in self.id_types:
+            self.id_types[key] = external_id_type
+
+    def resolve(self, external_db_name, external_ids) -> dict:
+        """
+        Look up many ids of one external database at once.
+
+        Args:
+            external_db_name: the name of the external database, as in ExternalReference.external_db_name
+            external_ids: iterable of ids in that database
+
+        Returns:
+            dict: every requested id (as given) mapped to the list of matching URIs, empty if there is none
+        """
+        external = self.external
+        return {
+            external_id: list(external.get(_external_key(external_db_name, external_id), ()))
+            for external_id in external_ids
+        }
+
+    def references(self, uri: str, external_db_name=None) -> List[tuple]:
+        """The (external_db_name, external_id, external_id_type) of a person, optionally for one external database only."""
+        return [
+            key + (self.id_types.get(key),)
+            for key in self.persons.get(uri, ())
+            if external_db_name is None or key[0] == external_db_name
+        ]
+
+    def conflicts(self, external_db_name=None) -> dict:
+        """The external ids that map to more than one person, as (external_db_name, external_id) -> URIs."""
+        return {
+            key: list(uris) for key, uris in self.external.items()
+            if len(uris) > 1 and (external_db_name is None or key[0] == external_db_name)
+        }
+
+    def save(self, db):
+        """Replace the crosswalk table of an SQLite database with the contents of the index; errors are raised, not printed."""
+        con = sqlite3.connect(db)
+        try:
+            con.executescript(CROSSWALK_SQL)
+            with con:
+                con.execute('DELETE FROM "crosswalk"')
+                con.executemany(
+                    'INSERT INTO "crosswalk" (external_db_name, external_id, external_id_type, URI) VALUES (?, ?, ?, ?)',
+                    ((key[0], key[1], self.id_types.get(key), uri) for uri, keys in self.persons.items() for key in keys)
+                )
+        finally:
+            con.close()
+
+    @classmethod
+    def load(cls, db) -> 'CrosswalkIndex':
+        """
+        Load an index stored with save, without going through the persons again.
+        The database is opened read-only; without a crosswalk table the index is empty.
+        """
+        index = cls()
+        con = sqlite3.connect(Path(db).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'crosswalk'").fetchone() is None:
+                return index
+            for external_db_name, external_id, external_id_type, uri in con.execute(
+                'SELECT external_db_name, external_id, external_id_type, URI FROM "crosswalk" ORDER BY rowid'
+            ):
+                index.add(uri, external_db_name, external_id, external_id_type)
+        finally:
+            con.close()
+        return index
+
+    def summary(self) -> dict:
+        """The number of persons, external ids and conflicting external ids per external database."""
+        result = {}
+        for (external_db_name, _), uris in self.external.items():
+            counts = result.setdefault(external_db_name, {'external_ids': 0, 'persons': set(), 'conflicts': 0})
+            counts['external_ids'] += 1
+            counts['persons'].update(uris)
+            counts['conflicts'] += len(uris) > 1
+        for counts in result.values():
+            counts['persons'] = len(counts['persons'])
+        return result
+
+
+# In[ ]:
+
+
+# the lists of Person and the class of their instances
+ATTRIBUTE_CLASSES = dict(attribute for attribute in CSV_FILES.values() if attribute is not None)
+
+# fields with a small set of repeating values, stored as categoricals by ColumnarPersonList
+VOCAB_FIELDS = {'appellationType', 'toponym_location', 'activity', 'activityType', 'employer', 'employer_organization',
+                'identity', 'identityType', 'status', 'statusType', 'locationRelation', 'relation', 'event',
+                'location', 'observation_source', 'reconstruction_source', 'external_db_name', 'external_id_type'}
+
+# date: (its _min field, its _max field, numeric lower bound column, numeric upper bound column)
+DATE_BOUNDS = {
+    'startDate': ('startDate_min', 'startDate_max', 'startDate_lower', 'startDate_upper'),
+    'endDate': ('endDate_min', 'endDate_max', 'endDate_lower', 'endDate_upper'),
+}
+
+_CSV_DATES = ['AnnotationDate', 'StartDate', 'EndDate', 'StartDate_Min', 'StartDate_Max', 'EndDate_Min', 'EndDate_Max']
+_CSV_SOURCES = ['Observation source', 'Location in Observation Source', 'Reconstruction Source',
+                'Location in Reconstruction Source', 'Comment']
+_CSV_LOCATION = ['Location', 'Original_Location_Description']
+_CSV_LABELS = ['URI', 'Observation', 'Reconstruction', 'Original Label']
+
+# the columns of the files written by to_csv, in order
+CSV_COLUMNS = {
+    'overview.csv': ['URI', 'rdfs:label', 'Comment'],
+    'appellations.csv': ['URI', 'Observation', 'Reconstruction', 'Appellation', 'AppellationType'] + _CSV_DATES
+                        + ['Toponym', 'Toponym_Location'] + _CSV_SOURCES,
+    'activities.csv': _CSV_LABELS + ['Activity', 'ActivityType', 'Employer', 'Employer_Organization'] + _CSV_LOCATION
+                      + _CSV_DATES + _CSV_SOURCES,
+    'identities.csv': _CSV_LABELS + ['Identity', 'IdentityType'] + _CSV_LOCATION + _CSV_DATES + _CSV_SOURCES,
+    'statuses.csv': _CSV_LABELS + ['Status', 'StatusType'] + _CSV_LOCATION + _CSV_DATES + _CSV_SOURCES,
+    'locationRelations.csv': _CSV_LABELS + ['LocationRelation'] + _CSV_LOCATION + _CSV_DATES + _CSV_SOURCES,
+    'relations.csv': _CSV_LABELS + ['Relation', 'OtherPerson'] + _CSV_DATES + _CSV_SOURCES,
+    'events.csv': _CSV_LABELS + ['Event', 'Argument'] + _CSV_LOCATION + _CSV_DATES + _CSV_SOURCES,
+    'external_references.csv': ['URI', 'Reconstruction ID', 'External DB Name', 'External ID', 'External ID Type'],
+}
+
+# the to_csv flag of every file
+CSV_FLAGS = {
+    'overview.csv': 'makeOverview', 'appellations.csv': 'makeAppellations', 'activities.csv': 'makeActive_as',
+    'identities.csv': 'makeIdentities', 'statuses.csv': 'makeStatuses', 'locationRelations.csv': 'makeLocation_relations',
+    'relations.csv': 'makeRelations', 'events.csv': 'makeEvents', 'external_references.csv': 'makeExternalReferences',
+}
+
+
+def _factorize(column: pd.Series):
+    """Codes (-1 for missing) and unique values of a column, taken from the categories of a categorical as they are."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), list(column.cat.categories)
+    codes, uniques = pd.factorize(column)
+    return codes, list(uniques)
+
+
+def _lookup(values: list) -> np.ndarray:
+    """An object array of values with None appended, so indexing it with codes maps -1 to None."""
+    lookup = np.empty(len(values) + 1, dtype=object)
+    lookup[:len(values)] = values
+    return lookup
+
+
+def _date_ordinal(value, bound: int) -> float:
+    """Ordinal day number of the first (bound 0) or last (bound 1) day of a date, NaN if it is not a date."""
+    bounds = Person._date_bounds(value)
+    if bounds is not None:
+        year, month, day = bounds[bound].split('-')
+        try:
+            return datetime(int(year), int(month), int(day)).toordinal()
+        except ValueError:
+            pass
+    return np.nan
+
+
+def _date_ordinals(column: pd.Series, bound: int) -> np.ndarray:
+    """Ordinal day numbers of the first (bound 0) or last (bound 1) day of the dates in a column, NaN where there is none."""
+    codes, uniques = _factorize(column)
+    return np.array([_date_ordinal(value, bound) for value in uniques] + [np.nan])[codes]
+
+
+@dataclass(eq=False)
+class ColumnarPersonList:
+    """
+    A PersonList stored as columns instead of objects, so bulk operations work on whole arrays.
+    persons has the id, URI, rdfs_label and comment of every person. tables has a table per Person list (see ATTRIBUTE_CLASSES)
+    with one row per instance, ordered by person: a 'person' column with the position of the person in persons and a
+    column per field. Fields in VOCAB_FIELDS are categoricals, and startDate and endDate get numeric bounds (see DATE_BOUNDS):
+    ordinal day numbers of the first and last possible day, from the _min/_max fields or else from the date itself.
+    Indexing or iterating gives a PersonView per person, with the per-person API of Person.
+    Assigning a list through a PersonView rewrites the whole table, so edit many persons inside batch(),
+    or better with the bulk methods.
+    """
+    persons: pd.DataFrame = field(default_factory=lambda: pd.DataFrame({n: pd.Series(dtype=object) for n in ['id', 'URI', 'rdfs_label', 'comment']}))
+    tables: dict = field(default_factory=dict)
+    _pending: Optional[dict] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if 'id' not in self.persons.columns:
+            self.persons.insert(0, 'id', pd.Series([None] * len(self.persons), index=self.persons.index, dtype=object))
+        for attribute_name in ATTRIBUTE_CLASSES:
+            if attribute_name not in self.tables:
+                self.tables[attribute_name] = self._make_table(attribute_name, [], [])
+
+    @classmethod
+    def from_person_list(cls, person_list: PersonList) -> 'ColumnarPersonList':
+        """Copy a PersonList into columns."""
+        persons = pd.DataFrame({
+            'id': pd.Series([p.id for p in person_list.persons], dtype=object),
+            'URI': pd.Series([p.URI for p in person_list.persons], dtype=object),
+            'rdfs_label': pd.Series([p.rdfs_label for p in person_list.persons], dtype=object),
+            'comment': pd.Series([p.comment for p in person_list.persons], dtype=object),
+        })
+
+        tables = {}
+        for attribute_name, attribute_class in ATTRIBUTE_CLASSES.items():
+            getter = attrgetter(*[f.name for f in fields(attribute_class)])
+            person_index, rows = [], []
+            for i, p in enumerate(person_list.persons):
+                instances = getattr(p, attribute_name)
+                person_index.extend([i] * len(instances))
+                rows.extend(map(getter, instances))
+            tables[attribute_name] = cls._make_table(attribute_name, person_index, rows)
+
+        return cls(persons, tables)
+
+    def to_person_list(self) -> PersonList:
+        """Build Person objects from the columns again."""
+        persons = []
+        for person_id, uri, label, comment in self.persons[['id', 'URI', 'rdfs_label', 'comment']].itertuples(index=False, name=None):
+            p = Person(id=person_id, URI=uri, comment=comment)
+            if label is not None:
+                p.rdfs_label = label
+            persons.append(p)
+
+        for attribute_name, table in self.tables.items():
+            for i, instance in zip(table['person'], self._instances(attribute_name, table)):
+                getattr(persons[i], attribute_name).append(instance)
+
+        return PersonList(persons)
+
+    @staticmethod
+    def _make_table(attribute_name: str, person_index: list, rows: list) -> pd.DataFrame:
+        """A table from the field values of instances, with object columns so None and ints stay as they are."""
+        field_names = [f.name for f in fields(ATTRIBUTE_CLASSES[attribute_name])]
+        table = pd.DataFrame(rows if rows else None, columns=field_names, dtype=object)
+        table.insert(0, 'person', np.asarray(person_index, dtype=np.int64))
+        for field_name in VOCAB_FIELDS.intersection(field_names):
+            table[field_name] = table[field_name].astype('category')
+        ColumnarPersonList._update_bounds(table)
+        return table
+
+    @staticmethod
+    def _update_bounds(table: pd.DataFrame):
+        """(Re)compute the numeric date bounds of a table from its date strings."""
+        for date_field, (min_field, max_field, lower_column, upper_column) in DATE_BOUNDS.items():
+            if date_field not in table.columns:
+                continue
+            lower = _date_ordinals(table[min_field], 0)
+            upper = _date_ordinals(table[max_field], 1)
+            table[lower_column] = np.where(np.isnan(lower), _date_ordinals(table[date_field], 0), lower)
+            table[upper_column] = np.where(np.isnan(upper), _date_ordinals(table[date_field], 1), upper)
+
+    @staticmethod
+    def _set_values(table: pd.DataFrame, field_name: str, values):
+        """Replace a column, keeping None for missing values and the categorical type of vocab fields."""
+        values = pd.Series(values, index=table.index, dtype=object)
+        values = values.where(values.notna(), None)
+        table[field_name] = values.astype('category') if field_name in VOCAB_FIELDS else values
+        if field_name in PersonAttribute._date_fields:
+            ColumnarPersonList._update_bounds(table)
+
+    @staticmethod
+    def _instances(attribute_name: str, rows: pd.DataFrame) -> list:
+        """Build instances of the class of an attribute from rows of its table."""
+        attribute_class = ATTRIBUTE_CLASSES[attribute_name]
+        columns = [f.name for f in fields(attribute_class)]
+        values = rows[columns].astype(object)
+        values = values.where(values.notna(), None).itertuples(index=False, name=None)
+        if issubclass(attribute_class, PersonAttribute):
+            defaults = dict.fromkeys(columns)
+            return [attribute_class._from_validated(defaults, columns, row) for row in values]
+        return [attribute_class(*row) for row in values]
+
+    def _rows(self, attribute_name: str, i: int) -> slice:
+        """The positions of the rows of one person in a table."""
+        person = self.tables[attribute_name]['person'].to_numpy()
+        return slice(np.searchsorted(person, i, 'left'), np.searchsorted(person, i, 'right'))
+
+    def _replace_rows(self, attribute_name: str, i: int, instances: list):
+        """Replace the rows of one person in a table with the field values of instances, or collect them inside batch()."""
+        getter = attrgetter(*[f.name for f in fields(ATTRIBUTE_CLASSES[attribute_name])])
+        rows = [getter(a) for a in instances]
+        if self._pending is not None:
+            self._pending.setdefault(attribute_name, {})[i] = rows
+        else:
+            self._apply_replacements({attribute_name: {i: rows}})
+
+    def _pending_instances(self, attribute_name: str, i: int) -> Optional[list]:
+        """The instances assigned to one person inside batch() that are not in the table yet, or None."""
+        if self._pending is None or i not in self._pending.get(attribute_name, {}):
+            return None
+        rows = self._pending[attribute_name][i]
+        return self._instances(attribute_name, self._make_table(attribute_name, [i] * len(rows), rows))
+
+    def _apply_replacements(self, replacements: dict):
+        """Replace the rows of persons in their tables, rebuilding every table once: {attribute: {person: rows}}."""
+        for attribute_name, replaced in replacements.items():
+            table = self.tables[attribute_name]
+            people = sorted(replaced)
+            new_rows = self._make_table(attribute_name, [i for i in people for _ in replaced[i]],
+                                        [row for i in people for row in replaced[i]])
+            kept = table[~table['person'].isin(people).to_numpy()]
+            parts = [part for part in (kept, new_rows) if len(part)]
+            table = pd.concat(parts, ignore_index=True) if parts else new_rows
+            #a stable sort keeps the order of the rows within every person
+            table = table.sort_values('person', kind='stable', ignore_index=True)
+            for field_name in VOCAB_FIELDS.intersection(table.columns):
+                table[field_name] = table[field_name].astype(object).astype('category')
+            self.tables[attribute_name] = table
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the lists assigned through PersonViews (and their per-person methods) and write them to the tables
+        at once when the block ends, instead of rebuilding a table for every assignment.
+        Inside the block the views show their own new lists, but the tables and bulk methods still have the old rows.
+
+        Example:
+            with columns.batch():
+                for person in columns:
+                    person.expand_dates('active_as', 'startDate')
+        """
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = {}
+        try:
+            yield self
+        finally:
+            pending, self._pending = self._pending, None
+            self._apply_replacements(pending)
+
+    def _table(self, attribute_name: str, field_name: str) -> pd.DataFrame:
+        """The table of an attribute, after checking that the attribute and field exist."""
+        if attribute_name not in self.tables:
+            raise AttributeError(f"{attribute_name} is not a valid Person Attribute")
+        if field_name not in [f.name for f in fields(ATTRIBUTE_CLASSES[attribute_name])]:
+            raise AttributeError(f"{field_name} is not a valid field for {attribute_name}")
+        return self.tables[attribute_name]
+
+    def __len__(self):
+        return len(self.persons)
+
+    def __getitem__(self, i: int) -> 'PersonView':
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("person index out of range")
+        return PersonView(self, i)
+
+    def __iter__(self):
+        return (PersonView(self, i) for i in range(len(self)))
+
+    def split_list_values(self, attribute_name: str, field_name: str, separators: List[str], unused_remains: List[str], exceptions: List[str]):
+        """
+        Splits values in a field into multiple rows, like Person.split_values, for all persons at once.
+        A row whose value splits into more than one part is repeated once per part, in place.
+
+        Args:
+            attribute_name: Name of the Person list (e.g. 'active_as')
+            field_name: Name of the field to split (e.g. 'location')
+            separators: List of substrings to split the value on
+            unused_remains: List of split values to ignore/remove
+            exceptions: List of full values that should not be split
+        """
+        table = self._table(attribute_name, field_name)
+
+        values = table[field_name].astype(object)
+        parts = values[values.map(lambda value: isinstance(value, str)).astype(bool) & (values != '')]
+        parts = parts[~parts.str.strip().isin(exceptions)]
+        for sep in separators:
+            parts = parts.str.split(sep, regex=False).explode().str.strip()
+        parts = parts[(parts != '') & ~parts.isin(unused_remains)]
+
+        counts = parts.groupby(level=0).size()
+        counts = counts[counts > 1]
+        if counts.empty:
+            return
+
+        repeats = np.ones(len(table), dtype=np.int64)
+        repeats[counts.index.to_numpy()] = counts.to_numpy()
+        table = table.iloc[np.repeat(np.arange(len(table)), repeats)].reset_index(drop=True)
+
+        values = table[field_name].astype(object).to_numpy(copy=True)
+        values[np.repeat(repeats > 1, repeats)] = parts[parts.index.isin(counts.index)].to_numpy()
+        self._set_values(table, field_name, values)
+        self.tables[attribute_name] = table
+
+    def link_list_values(self, mapping: dict, attribute_name: str, field_name: str, log_file: str = "unmatched_values.txt"):
+        """
+        Replaces values in a field with the mapped values in a dictionary, like Person.link_values, for all persons at once.
+        The mapping is looked up once per distinct value, and every unmatched value is logged once.
+
+        Args:
+            mapping: a dictionary containing key:value pairs linking a string to an URI or other external identifier.
+            attribute_name: the Person list (e.g. 'appellations', or 'active_as') that you want to link a value in
+            field_name: the field (e.g. activity, or location, or appellationType) that you want to link using the dict
+            log_file: where key errors will be logged that need to get a mapping
+        """
+        table = self._table(attribute_name, field_name)
+
+        codes, uniques = _factorize(table[field_name])
+        used = np.zeros(len(uniques), dtype=bool)
+        used[codes[codes >= 0]] = True
+        keys = [_mapping_key(mapping, value) for value in uniques]
+        matched = np.array([key is not None for key in keys], dtype=bool)
+
+        if (matched & used).any():
+            lookup = _lookup([mapping[key] if m else value for value, key, m in zip(uniques, keys, matched)])
+            self._set_values(table, field_name, lookup[codes])
+
+        unmatched = [value for value, m, u in zip(uniques, matched, used) if u and not m]
+        if unmatched:
+            with open(log_file, "a", encoding="utf-8") as f:
+                for val in unmatched:
+                    f.write(f"{val}\n")
+
+    def lowercase_list_values(self, attribute_name: str, field_name: str):
+        """Lowercases the values in a field, like Person.lowercase_values, once per distinct value."""
+        table = self._table(attribute_name, field_name)
+        codes, uniques = _factorize(table[field_name])
+        lowered = [normalize_string(value) for value in uniques]
+        if lowered != uniques:
+            self._set_values(table, field_name, _lookup(lowered)[codes])
+
+    def expand_list_dates(self, attribute_name: str, field_name: str):
+        """Fills the empty _min and _max bounds of startDate or endDate, like Person.expand_dates, once per distinct date."""
+        if field_name not in DATE_BOUNDS:
+            raise AttributeError(f"{field_name} is not a date field with bounds, use startDate or endDate")
+        table = self._table(attribute_name, field_name)
+
+        codes, uniques = _factorize(table[field_name])
+        bounds = [Person._date_bounds(value) or (None, None) for value in uniques]
+        for bound, bound_field in enumerate(DATE_BOUNDS[field_name][:2]):
+            current = table[bound_field].astype(object).to_numpy()
+            expanded = _lookup([b[bound] for b in bounds])[codes]
+            fill = (current == None) & (expanded != None)
+            if fill.any():
+                self._set_values(table, bound_field, np.where(fill, expanded, current))
+
+    def persons_with(self, attribute_name: str, field_name: str, values) -> np.ndarray:
+        """A boolean array over the persons: True for those with at least one row with one of the values in the field."""
+        table = self._table(attribute_name, field_name)
+        rows = table[field_name].isin(values).to_numpy()
+        mask = np.zeros(len(self.persons), dtype=bool)
+        mask[table['person'].to_numpy()[rows]] = True
+        return mask
+
+    def select(self, mask) -> 'ColumnarPersonList':
+        """
+        A new ColumnarPersonList with only the persons where mask is True.
+
+        Args:
+            mask: a boolean array with an entry per person, e.g. from persons_with or a condition on persons
+
+        Returns:
+            ColumnarPersonList: the selected persons with all their rows
+        """
+        mask = np.asarray(mask, dtype=bool)
+        new_index = np.cumsum(mask) - 1
+
+        tables = {}
+        for attribute_name, table in self.tables.items():
+            table = table[mask[table['person'].to_numpy()]].reset_index(drop=True)
+            table['person'] = new_index[table['person'].to_numpy()]
+            tables[attribute_name] = table
+
+        return ColumnarPersonList(self.persons[mask].reset_index(drop=True), tables)
+
+    def timeline(self, attributes: Optional[dict] = None) -> 'Timeline':
+        """The dated careers of all persons, from the numeric date bounds, see Timeline."""
+        return Timeline.from_columns(self, attributes)
+
+    def to_csv(self, makeOverview=True, makeAppellations=True, makeActive_as=True, makeIdentities=True, makeStatuses=True, makeLocation_relations=True, makeRelations=True, makeEvents=True, makeExternalReferences=True, directory='.', append=False):
+        """
+        Export to the same CSV files as PersonList.to_csv, one column at a time.
+
+        Parameters:
+        - makeOverview ... makeExternalReferences: Whether to create each CSV file, as in PersonList.to_csv
+        - directory: The directory to write the CSV files to
+        - append: Whether to add the rows to existing CSV files (without repeating the header) instead of replacing them
+        """
+        make = _export_flags(locals())
+        uris = self.persons['URI'].to_numpy()
+
+        for filename, headers in CSV_COLUMNS.items():
+            if not make[CSV_FLAGS[filename]]:
+                continue
+
+            if filename == 'overview.csv':
+                frame = pd.DataFrame({
+                    'URI': self.persons['URI'],
+                    'rdfs:label': self.persons['rdfs_label'],
+                    'Comment': self.persons['comment'].where(self.persons['comment'].notna(), '-1'),
+                })
+                PersonList._write_frame(frame, filename, directory, append)
+                continue
+
+            table = self.tables[CSV_FILES[filename][0]]
+            frame = pd.DataFrame({header: table[CSV_HEADERS[header]].astype(object) for header in headers[1:]})
+            frame = frame.where(frame.notna(), '-1')
+            frame.insert(0, 'URI', uris[table['person'].to_numpy()])
+            PersonList._write_frame(frame, filename, directory, append, encoding="UTF-8")
+
+
+class PersonView:
+    """
+    One person of a ColumnarPersonList, with the fields, lists and per-person methods of Person.
+    The lists are built from the columns when they are read and written back when they are assigned,
+    so changing a returned instance does not change the columns; assign the list or use the methods instead.
+    Views are meant for reading: every assignment rewrites a table, so edit many views inside ColumnarPersonList.batch().
+    """
+    __slots__ = ('_columns', '_index')
+
+    _person_fields = ('id', 'URI', 'rdfs_label', 'comment')
+
+    def __init__(self, columns: ColumnarPersonList, index: int):
+        object.__setattr__(self, '_columns', columns)
+        object.__setattr__(self, '_index', index)
+
+    def __getattr__(self, name):
+        if name in PersonView._person_fields:
+            return self._columns.persons.at[self._index, name]
+        if name in ATTRIBUTE_CLASSES:
+            pending = self._columns._pending_instances(name, self._index)
+            if pending is not None:
+                return pending
+            rows = self._columns.tables[name].iloc[self._columns._rows(name, self._index)]
+            return self._columns._instances(name, rows)
+        raise AttributeError(f"{name} is not a valid Person Attribute")
+
+    def __setattr__(self, name, value):
+        if name in PersonView._person_fields:
+            self._columns.persons.at[self._index, name] = value
+        elif name in ATTRIBUTE_CLASSES:
+            self._columns._replace_rows(name, self._index, value)
+        else:
+            raise AttributeError(f"{name} is not a valid Person Attribute")
+
+    def __repr__(self):
+        return f"PersonView(URI={self.URI!r})"
+
+    def to_person(self) -> Person:
+        """A Person object with a copy of the data of this person."""
+        p = Person(id=self.id, URI=self.URI, comment=self.comment)
+        if self.rdfs_label is not None:
+            p.rdfs_label = self.rdfs_label
+        for attribute_name in ATTRIBUTE_CLASSES:
+            setattr(p, attribute_name, getattr(self, attribute_name))
+        return p
+
+    def _apply(self, attribute_name: str, method):
+        """Run a Person method on the instances of one list and write the result back."""
+        p = Person(URI=self.URI)
+        setattr(p, attribute_name, getattr(self, attribute_name))
+        method(p)
+        setattr(self, attribute_name, getattr(p, attribute_name))
+
+    def split_values(self, attribute_name: str, field_name: str, separators: List[str], unused_remains: List[str], exceptions: List[str]):
+        self._apply(attribute_name, lambda p: p.split_values(attribute_name, field_name, separators, unused_remains, exceptions))
+
+    def link_values(self, mapping: dict, attribute_name: str, field_name: str, log_file: str = "unmatched_values.txt"):
+        self._apply(attribute_name, lambda p: p.link_values(mapping, attribute_name, field_name, log_file))
+
+    def lowercase_values(self, attribute_name: str, field_name: str):
+        self._apply(attribute_name, lambda p: p.lowercase_values(attribute_name, field_name))
+
+    def expand_dates(self, attribute_name: str, field_name: str):
+        self._apply(attribute_name, lambda p: p.expand_dates(attribute_name, field_name))
+
+
+# In[ ]:
+
+
+# Person list: table of the SQLite export
+ATTRIBUTE_TABLES = {attribute_name: table for table, (_, attribute_name, _) in DB_EXPORT_TABLES.items() if attribute_name}
+
+# the range of a row used by PersonQuery.during, the same one ColumnarPersonList keeps as numeric bounds
+_QUERY_LOWER_SQL = 'COALESCE("startDate_min", "startDate")'
+_QUERY_UPPER_SQL = 'COALESCE("endDate_max", "endDate")'
+
+
+def build_query_indexes(db):
+    """
+    Adds the indexes PersonQuery uses to an exported database: on URI in every table and on the VOCAB_FIELDS columns,
+    and one on external_db_name and external_id for PersonLookupService.by_external_id (if that table exists).
+    Date filters are checked on the rows these indexes select; a period bounds a row on both sides, so an index
+    on one date bound is rarely selective enough to beat reading the table in order.
+    Existing indexes are kept, so it can be run after every update.
+
+    Args:
+        db: path to the SQLite database
+
+    Raises:
+        sqlite3.OperationalError: if an index cannot be made; PersonQuery would fall back to full scans otherwise
+    """
+    con = sqlite3.connect(db)
+    try:
+        with con:
+            for table in DB_EXPORT_TABLES:
+                columns = {row[1] for row in con.execute(f'PRAGMA table_info("{table}")')}
+                for column in sorted(columns & (VOCAB_FIELDS | {'URI'})):
+                    con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{column}" ON "{table}" ("{column}")')
+                #databases exported without makeExternalReferences have no such table
+                if table == 'externalReferences' and {'external_db_name', 'external_id'} <= columns:
+                    con.execute('CREATE INDEX IF NOT EXISTS "externalReferences_external_id" '
+                                'ON "externalReferences" ("external_db_name", "external_id")')
+    finally:
+        con.close()
+
+
+def _read_persons(con, uris: list) -> list:
+    """Build the Person objects of some URIs from an exported database, in the order of the URIs."""
+    placeholders = ', '.join('?' for _ in uris)
+    persons = {uri: Person(URI=uri) for uri in uris}
+
+    label = '"rdfs:label"' if 'rdfs:label' in {row[1] for row in con.execute('PRAGMA table_info("persons")')} else 'NULL'
+    #update_db adds a persons row on every write, so read them in order and let the latest one win
+    for uri, rdfs_label, comment in con.execute(f'SELECT URI, {label}, comment FROM persons WHERE URI IN ({placeholders}) ORDER BY id', uris):
+        persons[uri].comment = comment
+        persons[uri].rdfs_label = rdfs_label
+
+    for attribute_name, table in ATTRIBUTE_TABLES.items():
+        table_columns = {row[1] for row in con.execute(f'PRAGMA table_info("{table}")')}
+        columns = [c for c in DB_EXPORT_TABLES[table][2][1:] if c in table_columns]
+        attribute_class = ATTRIBUTE_CLASSES[attribute_name]
+        defaults = dict.fromkeys(f.name for f in fields(attribute_class))
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        for row in con.execute(f'SELECT URI, {column_list} FROM "{table}" WHERE URI IN ({placeholders}) ORDER BY id', uris):
+            if attribute_class is ExternalReference:
+                instance = ExternalReference(URI=row[0], **dict(zip(columns, row[1:])))
+            else:
+                instance = attribute_class._from_validated(defaults, columns, row[1:])
+            getattr(persons[row[0]], attribute_name).append(instance)
+
+    return list(persons.values())
+
+
+@dataclass(eq=False)
+class PersonListIndex:
+    """
+    Precomputed indexes over persons in memory for PersonQuery, built from a PersonList or ColumnarPersonList.
+    Value indexes (value -> row positions) are made per field the first time a query filters on it, and the rows
+    of every list are sorted once by their lower date bound. Build a new index after changing the persons.
+    """
+    person_list: object
+    columns: ColumnarPersonList = field(init=False, repr=False)
+    _values: dict = field(default_factory=dict, init=False, repr=False)
+    _dates: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if isinstance(self.person_list, ColumnarPersonList):
+            self.columns = self.person_list
+        else:
+            self.columns = self.person_list.to_columnar()
+
+    def column(self, attribute_name: str, name: str) -> pd.Series:
+        """A column of the table of a list; URI is taken from the persons, like in the SQLite export."""
+        table = self.columns.tables[attribute_name]
+        if name == 'URI':
+            return pd.Series(self.columns.persons['URI'].to_numpy()[table['person'].to_numpy()], dtype=object)
+        return table[name]
+
+    def positions(self, attribute_name: str, name: str, values) -> np.ndarray:
+        """The sorted positions of the rows with one of the values in a field, None for a missing value."""
+        key = (attribute_name, name)
+        if key not in self._values:
+            codes, uniques = _factorize(self.column(attribute_name, name))
+            order = np.argsort(codes, kind='stable')
+            starts = np.searchsorted(codes[order], np.arange(-1, len(uniques) + 1))
+            index = {value: order[starts[i + 1]:starts[i + 2]] for i, value in enumerate(uniques)}
+            index[None] = order[starts[0]:starts[1]]
+            self._values[key] = index
+
+        index = self._values[key]
+        found = [index[value] for value in values if value in index]
+        return np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def overlapping(self, attribute_name: str, lower: float, upper: float) -> np.ndarray:
+        """The sorted positions of the rows whose date range overlaps the ordinal days lower-upper, NaN for open ends."""
+        if attribute_name not in self._dates:
+            table = self.columns.tables[attribute_name]
+            row_lower, row_upper = table['startDate_lower'].to_numpy(), table['endDate_upper'].to_numpy()
+            order = np.argsort(row_lower, kind='stable')
+            self._dates[attribute_name] = (order, row_lower[order], row_lower, row_upper)
+
+        order, sorted_lower, row_lower, row_upper = self._dates[attribute_name]
+        if np.isnan(upper):
+            candidates = order
+        else:
+            #NaN sorts last, so the rows without a lower bound are at the end, and they are always candidates
+            candidates = np.concatenate([order[:np.searchsorted(sorted_lower, upper, 'right')], order[np.isnan(sorted_lower)]])
+
+        candidate_lower, candidate_upper = row_lower[candidates], row_upper[candidates]
+        keep = ~(np.isnan(candidate_lower) & np.isnan(candidate_upper))
+        if not np.isnan(lower):
+            keep &= np.isnan(candidate_upper) | (candidate_upper >= lower)
+        return np.sort(candidates[keep])
+
+
+@dataclass(frozen=True)
+class PersonQuery:
+    """
+    A query on one Person list, e.g. PersonQuery('active_as').where(activity='koopman').during('1620', '1630').
+    Every method returns a new query, and rows or persons run it against a source:
+    a path to an SQLite export or a connection (including connect_catalog), where the filters become SQL,
+    or a PersonList, ColumnarPersonList or PersonListIndex in memory, where they use the indexes of PersonListIndex.
+
+    A row matches during(start, end) when its range, from startDate_min or else startDate up to endDate_max or else endDate,
+    overlaps the period; a missing end of the range is open, but rows without any of these dates never match.
+    In SQLite the dates are compared as strings, which assumes zero-padded months and days, as written by expand_dates.
+    """
+    attribute_name: str
+    conditions: tuple = ()
+    period: Optional[tuple] = None
+    columns: Optional[tuple] = None
+
+    def __post_init__(self):
+        if self.attribute_name not in ATTRIBUTE_TABLES:
+            raise AttributeError(f"{self.attribute_name} is not a valid Person Attribute")
+
+    @property
+    def table(self) -> str:
+        return ATTRIBUTE_TABLES[self.attribute_name]
+
+    def _check_field(self, name: str):
+        if name not in DB_EXPORT_TABLES[self.table][2]:
+            raise AttributeError(f"{name} is not a valid field for {self.attribute_name}")
+
+    def where(self, **conditions) -> 'PersonQuery':
+        """Keep the rows where every field has the value, or one of the values if a list, tuple or set is given."""
+        added = []
+        for name, values in conditions.items():
+            self._check_field(name)
+            values = tuple(values) if isinstance(values, (list, tuple, set, frozenset)) else (values,)
+            added.append((name, values))
+        return replace(self, conditions=self.conditions + tuple(added))
+
+    def at(self, *locations) -> 'PersonQuery':
+        """Keep the rows at one of the locations."""
+        return self.where(location=locations)
+
+    def during(self, start: Optional[str] = None, end: Optional[str] = None) -> 'PersonQuery':
+        """Keep the rows whose date range overlaps the period from start to end (yyyy, yyyy-mm or yyyy-mm-dd, None for open)."""
+        self._check_field('startDate')
+        for value in (start, end):
+            if value is not None and not PersonAttribute.vali_date(value):
+                raise ValueError(f'"{value}" is not a valid date, use yyyy, yyyy-mm or yyyy-mm-dd')
+        return replace(self, period=(start, end))
+
+    def select(self, *columns) -> 'PersonQuery':
+        """The fields that rows returns, in order; all exported fields, starting with URI, if none are selected."""
+        for name in columns:
+            self._check_field(name)
+        return replace(self, columns=columns)
+
+    def rows(self, source):
+        """
+        Run the query and return the matching rows.
+
+        Args:
+            source: an SQLite database path or connection, or a PersonList, ColumnarPersonList or PersonListIndex
+
+        Returns:
+            iterator: a tuple per matching row with the selected fields, produced while it is iterated
+        """
+        columns = list(self.columns or DB_EXPORT_TABLES[self.table][2])
+        if isinstance(source, (str, os.PathLike, sqlite3.Connection)):
+            return self._sql_rows(source, columns)
+        return self._memory_rows(self._index(source), columns)
+
+    def persons(self, source, batch_size: int = 500):
+        """
+        Run the query and return the persons with at least one matching row, in the order of their first match.
+
+        Args:
+            source: an SQLite database path or connection, or a PersonList, ColumnarPersonList or PersonListIndex
+            batch_size: from SQLite, the number of persons that are read at a time
+
+        Returns:
+            iterator: Person objects (the objects of the PersonList, PersonView objects for a ColumnarPersonList,
+            or new objects read from the database), produced while it is iterated
+        """
+        if isinstance(source, (str, os.PathLike, sqlite3.Connection)):
+            return self._sql_persons(source, batch_size)
+        return self._memory_persons(self._index(source))
+
+    # SQLite
+
+    def _sql(self, con, columns) -> Tuple[str, list]:
+        table_columns = {row[1] for row in con.execute(f'PRAGMA table_info("{self.table}")')}
+
+        clauses, parameters = [], []
+        for name, values in self.conditions:
+            if name not in table_columns:
+                raise AttributeError(f"{name} is not a column of the {self.table} table in this database")
+            present = [v for v in values if v is not None]
+            parts = [f'"{name}" IN ({", ".join("?" for _ in present)})'] if present else []
+            if len(present) < len(values):
+                parts.append(f'"{name}" IS NULL')
+            clauses.append('(' + ' OR '.join(parts) + ')' if parts else '0')
+            parameters.extend(present)
+
+        if self.period is not None:
+            start, end = self.period
+            clauses.append(f'({_QUERY_LOWER_SQL} IS NOT NULL OR {_QUERY_UPPER_SQL} IS NOT NULL)')
+            if end is not None:
+                #a row starts before the end of the period if its first day is not later than the last day of the period
+                clauses.append(f'({_QUERY_LOWER_SQL} IS NULL OR {_QUERY_LOWER_SQL} <= ?)')
+                parameters.append(Person._date_bounds(end)[1])
+            if start is not None:
+                #a row ends after the start of the period if its last day is not earlier: compare on its own precision
+                clauses.append(f'({_QUERY_UPPER_SQL} IS NULL OR {_QUERY_UPPER_SQL} >= substr(?, 1, length({_QUERY_UPPER_SQL})))')
+                parameters.append(Person._date_bounds(start)[0])
+
+        select = ', '.join(f'"{c}"' if c in table_columns else f'NULL AS "{c}"' for c in columns)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return f'SELECT {select} FROM "{self.table}"{where} ORDER BY id', parameters
+
+    def _sql_rows(self, source, columns):
+        con = source if isinstance(source, sqlite3.Connection) else sqlite3.connect(source)
+        try:
+            query, parameters = self._sql(con, columns)
+            yield from con.execute(query, parameters)
+        finally:
+            if con is not source:
+                con.close()
+
+    def _sql_persons(self, source, batch_size):
+        con = source if isinstance(source, sqlite3.Connection) else sqlite3.connect(source)
+        try:
+            query, parameters = self._sql(con, ['URI'])
+            seen, batch = set(), []
+            for (uri,) in con.execute(query, parameters):
+                if uri not in seen:
+                    seen.add(uri)
+                    batch.append(uri)
+                if len(batch) == batch_size:
+                    yield from _read_persons(con, batch)
+                    batch = []
+            if batch:
+                yield from _read_persons(con, batch)
+        finally:
+            if con is not source:
+                con.close()
+
+    # in memory
+
+    @staticmethod
+    def _index(source) -> PersonListIndex:
+        return source if isinstance(source, PersonListIndex) else PersonListIndex(source)
+
+    def _memory_positions(self, index: PersonListIndex) -> np.ndarray:
+        positions = None
+        for name, values in self.conditions:
+            found = index.positions(self.attribute_name, name, values)
+            positions = found if positions is None else np.intersect1d(positions, found, assume_unique=True)
+
+        if self.period is not None:
+            start, end = self.period
+            found = index.overlapping(self.attribute_name, _date_ordinal(start, 0), _date_ordinal(end, 1))
+            positions = found if positions is None else np.intersect1d(positions, found, assume_unique=True)
+
+        if positions is None:
+            positions = np.arange(len(index.columns.tables[self.attribute_name]))
+        return positions
+
+    def _memory_rows(self, index: PersonListIndex, columns, chunk_size: int = 10000):
+        positions = self._memory_positions(index)
+        known = set(index.columns.tables[self.attribute_name].columns) | {'URI'}
+        for begin in range(0, len(positions), chunk_size):
+            chunk = positions[begin:begin + chunk_size]
+            values = []
+            for name in columns:
+                if name in known:
+                    column = index.column(self.attribute_name, name).iloc[chunk].astype(object)
+                    values.append(column.where(column.notna(), None).tolist())
+                else:
+                    values.append([None] * len(chunk))
+            yield from zip(*values)
+
+    def _memory_persons(self, index: PersonListIndex):
+        person = index.columns.tables[self.attribute_name]['person'].to_numpy()[self._memory_positions(index)]
+        uniques, first = np.unique(person, return_index=True)
+        for i in uniques[np.argsort(first)]:
+            if isinstance(index.person_list, PersonList):
+                yield index.person_list.persons[i]
+            else:
+                yield index.columns[int(i)]
+
+
+# In[ ]:
+
+
+def _person_lookup_sql(con) -> Tuple[str, list]:
+    """
+    One statement that reads a person (?1) with the rows of all its attribute tables, each table as a JSON array of rows,
+    together with the columns of every table, in the order of ATTRIBUTE_TABLES.
+    """
+    person_columns = {row[1] for row in con.execute('PRAGMA table_info("persons")')}
+    label = '"rdfs:label"' if 'rdfs:label' in person_columns else 'NULL'
+    parts = [
+        'EXISTS (SELECT 1 FROM persons WHERE URI = ?1)',
+        #update_db adds a persons row on every write, the latest one holds the current values
+        f'(SELECT {label} FROM persons WHERE URI = ?1 ORDER BY id DESC LIMIT 1)',
+        '(SELECT comment FROM persons WHERE URI = ?1 ORDER BY id DESC LIMIT 1)',
+    ]
+
+    table_columns = []
+    for attribute_name, table in ATTRIBUTE_TABLES.items():
+        existing = {row[1] for row in con.execute(f'PRAGMA table_info("{table}")')}
+        columns = [c for c in DB_EXPORT_TABLES[table][2][1:] if c in existing]
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        parts.append(
+            f'(SELECT json_group_array(json_array({column_list})) '
+            f'FROM (SELECT {column_list} FROM "{table}" WHERE URI = ?1 ORDER BY id))'
+        )
+        table_columns.append(columns)
+
+    return 'SELECT ' + ',\n       '.join(parts), table_columns
+
+
+class PersonLookupService:
+    """
+    Read-only lookups of persons by URI, name or external id in a database written by update_db, for use with asyncio.
+    Queries run on a pool of read-only connections in worker threads, so the event loop is never blocked.
+    Every connection keeps its statements prepared, and a person is read with all its tables in a single statement.
+    Results are kept in an LRU cache that is emptied as soon as another connection, such as update_db, commits a change,
+    which SQLite reports through PRAGMA data_version. The returned Person objects are shared through the cache:
+    do not change them.
+
+    Usage:
+        async with PersonLookupService("historical_persons.sqlite") as service:
+            person = await service.person(uri)
+    """
+
+    def __init__(self, db, pool_size: int = 4, cache_size: int = 4096):
+        self.db = db
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._pool = None
+        self._waiters = deque()
+        self._watch_lock = threading.Lock()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _connect(self):
+        con = sqlite3.connect(Path(self.db).resolve().as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+        con.execute('PRAGMA query_only = ON')
+        return con
+
+    async def open(self):
+        """Open the connections and prepare the lookup statement, in a worker thread."""
+        if not os.path.exists(self.db):
+            raise FileNotFoundError(f"{self.db} does not exist")
+
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        self._pool = await asyncio.get_running_loop().run_in_executor(self._executor, self._open_connections)
+
+    def _open_connections(self) -> list:
+        #a connection of its own to watch for changes
+        self._watch = self._connect()
+        self._version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+        self._person_sql, self._table_columns = _person_lookup_sql(self._watch)
+        self._searchable = self._watch.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'appellations_fts'"
+        ).fetchone() is not None
+
+        pool = []
+        for _ in range(self.pool_size):
+            con = self._connect()
+            #prepare the lookup statement on every connection before the first request
+            con.execute(self._person_sql, ('',)).fetchone()
+            pool.append(con)
+        return pool
+
+    async def close(self):
+        """
+        Close all connections, in a worker thread after the running queries are done.
+        Connections still in use by cancelled requests are closed when their query finishes.
+        """
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(RuntimeError(f"The lookup service for {self.db} is closed"))
+        await asyncio.get_running_loop().run_in_executor(None, self._close_connections, pool)
+
+    def _close_connections(self, pool: list):
+        self._executor.shutdown(wait=True)
+        for con in pool:
+            con.close()
+        self._watch.close()
+
+    def invalidate(self):
+        """Empty the cache."""
+        self._cache.clear()
+
+    async def _acquire(self):
+        """
+        Take a connection from the pool, or wait for one. A released connection is handed straight to the longest
+        waiting request, so a request that just released one cannot take it back and make the others wait longer.
+        """
+        if self._pool is None:
+            raise RuntimeError(f"The lookup service for {self.db} is not open")
+        if self._pool and not self._waiters:
+            return self._pool.pop()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())
+            raise
+
+    def _release(self, con):
+        if self._pool is None:
+            con.close()
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(con)
+                return
+        self._pool.append(con)
+
+    async def _run(self, function, *args):
+        """
+        Run function(connection, *args) on a pooled connection in a worker thread.
+        The connection goes back to the pool when the worker is done with it, not when the awaiting request is,
+        so a cancelled request (e.g. by asyncio.wait_for) never hands out a connection that is still in use.
+        """
+        con = await self._acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, function, con, *args)
+        except BaseException:
+            self._release(con)
+            raise
+
+        def release(done):
+            #the result of a cancelled request is not needed, but should not be reported as never retrieved
+            if not done.cancelled():
+                done.exception()
+            self._release(con)
+
+        future.add_done_callback(release)
+        return await asyncio.shield(future)
+
+    def _data_version(self) -> int:
+        #the watch connection is shared by all requests, so one worker thread at a time
+        with self._watch_lock:
+            return self._watch.execute('PRAGMA data_version').fetchone()[0]
+
+    async def _cached(self, key, function, *args):
+        version = await asyncio.get_running_loop().run_in_executor(self._executor, self._data_version)
+        if version != self._version:
+            self._version = version
+            self._cache.clear()
+
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        value = await self._run(function, *args)
+        #a commit seen by another request during the read may have made the value stale, so do not cache it then
+        if self._version != version:
+            return value
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def _read_person(self, con, uri: str) -> Optional[Person]:
+        row = con.execute(self._person_sql, (uri,)).fetchone()
+        exists, rdfs_label, comment, tables = row[0], row[1], row[2], row[3:]
+        if not exists and all(rows == '[]' for rows in tables):
+            return None
+
+        p = Person(URI=uri, comment=comment)
+        if rdfs_label is not None:
+            p.rdfs_label = rdfs_label
+        for (attribute_name, attribute_class), columns, rows in zip(
+            ((name, ATTRIBUTE_CLASSES[name]) for name in ATTRIBUTE_TABLES), self._table_columns, tables
+        ):
+            if attribute_class is ExternalReference:
+                instances = [ExternalReference(URI=uri, **dict(zip(columns, values))) for values in json.loads(rows)]
+            else:
+                defaults = dict.fromkeys(f.name for f in fields(attribute_class))
+                instances = [attribute_class._from_validated(defaults, columns, values) for values in json.loads(rows)]
+            setattr(p, attribute_name, instances)
+        return p
+
+    @staticmethod
+    def _search_uris(con, name: str, limit: int) -> list:
+        return [uri for uri, _, _ in _appellation_matches(con, name, limit)]
+
+    @staticmethod
+    def _external_uris(con, external_db_name, external_id) -> list:
+        rows = con.execute(
+            'SELECT URI FROM externalReferences WHERE external_db_name IS ? AND external_id = ? GROUP BY URI ORDER BY MIN(id)',
+            (external_db_name, external_id)
+        )
+        return [uri for (uri,) in rows]
+
+    async def person(self, uri: str) -> Optional[Person]:
+        """The person with a URI, or None if the database has nothing about it."""
+        return await self._cached(('person', uri), self._read_person, uri)
+
+    async def persons(self, uris) -> List[Optional[Person]]:
+        """The persons with the URIs, looked up concurrently."""
+        return list(await asyncio.gather(*(self.person(uri) for uri in uris)))
+
+    async def search(self, name: str, limit: int = 10) -> List[Person]:
+        """The persons whose appellations best match a name, like search_persons."""
+        if not self._searchable:
+            raise ValueError(f"{self.db} has no appellation index, add it with build_appellation_index")
+        uris = await self._cached(('search', name, limit), self._search_uris, name, limit)
+        return await self.persons(uris)
+
+    async def by_external_id(self, external_db_name, external_id) -> List[Person]:
+        """The persons with an id in an external database; more than one means the id is in conflict."""
+        external_id = None if external_id is None else str(external_id).strip()
+        uris = await self._cached(('external', external_db_name, external_id), self._external_uris, external_db_name, external_id)
+        return await self.persons(uris)
+
+
+async def load_test(service: PersonLookupService, uris: list, requests: int = 10000, concurrency: int = 32) -> dict:
+    """
+    Measures the latency of person lookups under concurrent load.
+    Every worker looks up URIs in turn from the list, so repeated URIs show the effect of the cache.
+
+    Args:
+        service: an open PersonLookupService
+        uris: the URIs to look up
+        requests: the total number of lookups
+        concurrency: the number of lookups that run at the same time
+
+    Returns:
+        dict: requests, concurrency, p50_ms, p99_ms, max_ms, requests_per_second and cache_hit_rate
+    """
+    latencies = np.empty(requests)
+    hits, misses = service.hits, service.misses
+
+    async def worker(start):
+        for i in range(start, requests, concurrency):
+            begin = time.perf_counter()
+            await service.person(uris[i % len(uris)])
+            latencies[i] = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(worker(start) for start in range(concurrency)))
+    seconds = time.perf_counter() - begin
+
+    lookups = (service.hits - hits) + (service.misses - misses)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'max_ms': float(latencies.max() * 1000),
+        'requests_per_second': requests / seconds if seconds else float('inf'),
+        'cache_hit_rate': (service.hits - hits) / lookups if lookups else 0.0,
+    }
+
+
+def run_load_test(db, uris: list, requests: int = 10000, concurrency: int = 32, pool_size: int = 4, cache_size: int = 4096) -> dict:
+    """Runs load_test on a new PersonLookupService, outside of a running event loop (in a notebook, await load_test instead)."""
+    async def main():
+        async with PersonLookupService(db, pool_size, cache_size) as service:
+            return await load_test(service, uris, requests, concurrency)
+    return asyncio.run(main())
+
+
+# In[ ]:
+
+
+_DATE_PRECISION = ('year', 'month', 'day')
+
+
+@dataclass(eq=False)
+class VocabularyProfile:
+    """
+    Value statistics of all Person lists, collected in one walk over the persons and updated as more persons are added.
+    For every field it counts the rows and missing values, for the vocabulary fields (VOCAB_FIELDS, or the fields given
+    per list) it counts every value, and for the date fields it counts how many dates are a year, month or day.
+
+    Args:
+        vocabulary: optional dict of Person list name -> fields to count the values of, instead of VOCAB_FIELDS
+    """
+    vocabulary: Optional[dict] = None
+    persons: int = 0
+    rows: Counter = field(default_factory=Counter)
+    nulls: Counter = field(default_factory=Counter)
+    values: dict = field(default_factory=dict)
+    precision: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._fields = {}
+        for attribute_name, attribute_class in ATTRIBUTE_CLASSES.items():
+            field_names = [f.name for f in fields(attribute_class) if f.name != 'id']
+            if self.vocabulary is None:
+                counted = [f for f in field_names if f in VOCAB_FIELDS]
+            else:
+                counted = list(self.vocabulary.get(attribute_name, []))
+                for field_name in counted:
+                    if field_name not in field_names:
+                        raise AttributeError(f"{field_name} is not a valid field for {attribute_name}")
+            self._fields[attribute_name] = (attrgetter(*field_names), field_names, set(counted))
+            for field_name in counted:
+                self.values.setdefault((attribute_name, field_name), Counter())
+            for field_name in PersonAttribute._date_fields if issubclass(attribute_class, PersonAttribute) else ():
+                self.precision.setdefault((attribute_name, field_name), Counter())
+
+        if self.vocabulary is not None:
+            for attribute_name in self.vocabulary:
+                if attribute_name not in ATTRIBUTE_CLASSES:
+                    raise AttributeError(f"{attribute_name} is not a valid Person Attribute")
+
+    def add(self, persons, batch_size: int = 10000) -> 'VocabularyProfile':
+        """
+        Count the rows of more persons, e.g. a PersonList.persons, a chunk from stream_csv_persons or a single new person.
+        The rows are gathered per list for batch_size persons at a time and counted a column at a time.
+        """
+        batch = {attribute_name: [] for attribute_name in self._fields}
+        in_batch = 0
+        for p in persons:
+            for attribute_name, (getter, _, _) in self._fields.items():
+                batch[attribute_name].extend(map(getter, getattr(p, attribute_name)))
+            in_batch += 1
+            if in_batch == batch_size:
+                self._count(batch, in_batch)
+                batch = {attribute_name: [] for attribute_name in self._fields}
+                in_batch = 0
+        self._count(batch, in_batch)
+        return self
+
+    def _count(self, batch: dict, persons: int):
+        self.persons += persons
+        for attribute_name, rows in batch.items():
+            if not rows:
+                continue
+            _, field_names, counted = self._fields[attribute_name]
+            self.rows[attribute_name] += len(rows)
+            for field_name, column in zip(field_names, zip(*rows)):
+                key = (attribute_name, field_name)
+                self.nulls[key] += column.count(None)
+                if field_name in counted:
+                    self.values[key].update(column)
+                if key in self.precision:
+                    self.precision[key].update(value.count('-') for value in column if value is not None)
+
+    def merge(self, other: 'VocabularyProfile') -> 'VocabularyProfile':
+        """Add the counts of another profile, e.g. one made in another process."""
+        self.persons += other.persons
+        self.rows.update(other.rows)
+        self.nulls.update(other.nulls)
+        for key, counts in other.values.items():
+            self.values.setdefault(key, Counter()).update(counts)
+        for key, counts in other.precision.items():
+            self.precision.setdefault(key, Counter()).update(counts)
+        return self
+
+    def top(self, attribute_name: str, field_name: str, k: int = 20) -> List[tuple]:
+        """The k most frequent values of a counted field, with their counts, leaving out missing values."""
+        if (attribute_name, field_name) not in self.values:
+            raise AttributeError(f"the values of {field_name} in {attribute_name} are not counted")
+        counts = self.values[(attribute_name, field_name)]
+        return [(value, count) for value, count in counts.most_common(k + 1) if value is not None][:k]
+
+    def summary(self, k: int = 5) -> pd.DataFrame:
+        """A row per field: rows, missing values, null rate, distinct values and the k most frequent values of counted fields."""
+        records = []
+        for attribute_name, (_, field_names, counted) in self._fields.items():
+            rows = self.rows[attribute_name]
+            for field_name in field_names:
+                nulls = self.nulls[(attribute_name, field_name)]
+                counts = self.values.get((attribute_name, field_name))
+                records.append({
+                    'attribute': attribute_name,
+                    'field': field_name,
+                    'rows': rows,
+                    'nulls': nulls,
+                    'null_rate': nulls / rows if rows else None,
+                    'distinct': None if counts is None else len(counts) - (None in counts),
+                    'top': None if counts is None else '; '.join(
+                        f'{value} ({count})' for value, count in self.top(attribute_name, field_name, k)
+                    ),
+                })
+        return pd.DataFrame(records, columns=['attribute', 'field', 'rows', 'nulls', 'null_rate', 'distinct', 'top'])
+
+    def date_precision(self) -> pd.DataFrame:
+        """A row per date field with the number of dates given as a year, month or day, and the number missing."""
+        records = []
+        for (attribute_name, field_name), counts in self.precision.items():
+            record = {'attribute': attribute_name, 'field': field_name}
+            record.update({precision: counts[dashes] for dashes, precision in enumerate(_DATE_PRECISION)})
+            record['missing'] = self.nulls[(attribute_name, field_name)]
+            records.append(record)
+        return pd.DataFrame(records, columns=['attribute', 'field', *_DATE_PRECISION, 'missing'])
+
+    def linking_list(self, attribute_name: str, field_name: str, mapping: Optional[dict] = None, min_count: int = 1) -> pd.DataFrame:
+        """
+        The values of a counted field as a linking list for import_linking_list: original_label, URI and count,
+        most frequent first. Values that are already IRIs (linked before) are left out; the URI is filled in
+        from mapping where it has the value, and is empty for the curators to fill in otherwise.
+        """
+        mapping = mapping or {}
+        records = [
+            (value, mapping.get(value), count)
+            for value, count in self.top(attribute_name, field_name, len(self.values[(attribute_name, field_name)]))
+            if count >= min_count and not _is_iri(value)
+        ]
+        return pd.DataFrame(records, columns=['original_label', 'URI', 'count'])
+
+    def to_report(self, directory='.', k: int = 20, mapping: Optional[dict] = None, min_count: int = 1) -> List[str]:
+        """
+        Write the profile to a directory: summary.csv, date_precision.csv, and a linking list per counted field
+        named <list>.<field>.csv, which can be filled in and read with import_linking_list.
+
+        Args:
+            directory: the directory to write the files to
+            k: the number of most frequent values in summary.csv
+            mapping: an existing mapping (e.g. from import_linking_list) to fill in the URIs that are already known
+            min_count: leave values that occur less often out of the linking lists
+
+        Returns:
+            list: the paths of the files written
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, 'summary.csv'), os.path.join(directory, 'date_precision.csv')]
+        self.summary(k).to_csv(paths[0], index=False, encoding="UTF-8")
+        self.date_precision().to_csv(paths[1], index=False, encoding="UTF-8")
+
+        for attribute_name, field_name in self.values:
+            path = os.path.join(directory, f'{attribute_name}.{field_name}.csv')
+            self.linking_list(attribute_name, field_name, mapping, min_count).to_csv(path, index=False, encoding="UTF-8")
+            paths.append(path)
+        return paths
+
+
+# In[ ]:
+
+
+# compression of write_csv_concurrent: (function compressing one batch, file suffix)
+# every batch is its own gzip member or bz2 stream, which readers of these formats read as one file
+CSV_COMPRESSION = {
+    None: (None, ''),
+    'gzip': (partial(gzip.compress, compresslevel=6), '.gz'),
+    'bz2': (bz2.compress, '.bz2'),
+}
+
+
+class _CsvFileWriter:
+    """One output file of write_csv_concurrent: its bounded queue of batches and the state of the writes."""
+
+    def __init__(self, path, headers, header, queue_size):
+        self.path = path
+        self.headers = headers
+        self.header = header
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.bytes = 0
+        self.batches = 0
+
+    def write_next(self, handle, compress):
+        """Encode, compress and write the oldest batch; the lock keeps the batches of one file in order."""
+        with self.lock:
+            rows = self.queue.get_nowait()
+            #number the rows like one to_csv call for the whole file
+            frame = pd.DataFrame(rows, columns=self.headers, index=range(self.rows, self.rows + len(rows)))
+            data = frame.to_csv(header=self.header).encode('utf-8')
+            if compress is not None:
+                data = compress(data)
+            handle.write(data)
+            self.header = False
+            self.rows += len(rows)
+            self.bytes += len(data)
+            self.batches += 1
+
+
+def _csv_rows(filename: str):
+    """A function from a person to its rows in one of the files written by to_csv."""
+    if filename == 'overview.csv':
+        return lambda p: [(p.URI, p.rdfs_label, PersonList._format_value(p.comment))]
+
+    attribute_name = CSV_FILES[filename][0]
+    getter = attrgetter(*(CSV_HEADERS[header] for header in CSV_COLUMNS[filename][1:]))
+
+    def rows(p):
+        return [(p.URI,) + tuple('-1' if value is None else value for value in getter(a))
+                for a in getattr(p, attribute_name)]
+    return rows
+
+
+def write_csv_concurrent(persons, directory='.', files=None, workers: int = 4, compression: Optional[str] = None,
+                         batch_size: int = 5000, queue_size: int = 4, append: bool = False) -> dict:
+    """
+    Writes the CSV files of PersonList.to_csv with a pool of threads.
+    The persons are walked once, and their rows are collected in batches that go to a bounded queue per file.
+    Any worker thread can take the next batch of any file, encode it as CSV, compress it and write it,
+    so all files are written at the same time and a slow file never holds up the others.
+    Without compression the files are the same as those of to_csv.
+
+    Args:
+        persons: the persons to write, any iterable of Person (e.g. a PersonList or the persons of stream_csv_persons)
+        directory: the directory to write the CSV files to
+        files: the file names to write, as in CSV_COLUMNS (defaults to all nine)
+        workers: the number of threads that encode, compress and write
+        compression: None, 'gzip' or 'bz2'; compressed files get the suffix .gz or .bz2
+        batch_size: the number of rows in one batch
+        queue_size: the number of batches a file can have waiting, after which walking the persons waits for the writers
+        append: whether to add the rows to existing files (without repeating the header) instead of replacing them
+
+    Returns:
+        dict: seconds, rows, bytes, rows_per_second, mb_per_second, wait_seconds (time spent waiting for full queues),
+        workers, compression and per file its rows, bytes and batches
+    """
+    if compression not in CSV_COMPRESSION:
+        raise ValueError(f"{compression} is not a valid compression, use one of {list(CSV_COMPRESSION)}")
+    if files is None:
+        files = list(CSV_COLUMNS)
+    for filename in files:
+        if filename not in CSV_COLUMNS:
+            raise AttributeError(f"{filename} is not a valid CSV file")
+    compress, suffix = CSV_COMPRESSION[compression]
+
+    writers = {}
+    handles = {}
+    try:
+        for filename in files:
+            path = os.path.join(directory, filename + suffix)
+            header = not (append and os.path.exists(path))
+            writers[filename] = _CsvFileWriter(path, CSV_COLUMNS[filename], header, queue_size)
+            handles[filename] = open(path, 'ab' if append else 'wb')
+    except OSError:
+        for handle in handles.values():
+            handle.close()
+        raise
+
+    ready = queue.Queue()
+    errors = []
+
+    def work():
+        while True:
+            filename = ready.get()
+            if filename is None:
+                return
+            #after an error keep taking batches, so walking the persons does not wait on a full queue forever
+            if errors:
+                writers[filename].queue.get_nowait()
+                continue
+            try:
+                writers[filename].write_next(handles[filename], compress)
+            except Exception as e:
+                errors.append(e)
+
+    wait_seconds = 0.0
+
+    def send(filename, rows):
+        nonlocal wait_seconds
+        begin = time.perf_counter()
+        writers[filename].queue.put(rows)
+        wait_seconds += time.perf_counter() - begin
+        ready.put(filename)
+
+    row_functions = {filename: _csv_rows(filename) for filename in files}
+    pending = {filename: [] for filename in files}
+
+    begin = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    threads = [executor.submit(work) for _ in range(workers)]
+    try:
+        for p in persons:
+            for filename, rows in row_functions.items():
+                batch = pending[filename]
+                batch.extend(rows(p))
+                if len(batch) >= batch_size:
+                    send(filename, batch)
+                    pending[filename] = []
+
+        #the last batches, and an empty one for files without rows so they still get their header
+        for filename, batch in pending.items():
+            if batch or writers[filename].header:
+                send(filename, batch)
+    finally:
+        for _ in threads:
+            ready.put(None)
+        executor.shutdown(wait=True)
+        for handle in handles.values():
+            handle.close()
+    seconds = time.perf_counter() - begin
+
+    if errors:
+        raise errors[0]
+
+    rows = sum(w.rows for w in writers.values())
+    written = sum(w.bytes for w in writers.values())
+    return {
+        'seconds': seconds,
+        'rows': rows,
+        'bytes': written,
+        'rows_per_second': rows / seconds if seconds else float('inf'),
+        'mb_per_second': written / seconds / 1e6 if seconds else float('inf'),
+        'wait_seconds': wait_seconds,
+        'workers': workers,
+        'compression': compression,
+        'files': {filename: {'rows': w.rows, 'bytes': w.bytes, 'batches': w.batches} for filename, w in writers.items()},
+    }
+
+
+# In[ ]:
+
+
+# the Person lists a Timeline is built from by default, and the field that names each interval
+TIMELINE_FIELDS = {
+    'active_as': 'activity',
+    'statuses': 'status',
+    'location_relations': 'locationRelation',
+    'events': 'event',
+}
+
+_TIMELINE_COLUMNS = ['person', 'URI', 'attribute', 'row', 'observation_id', 'value', 'location',
+                     'start', 'end', 'start_certain', 'end_certain']
+
+#ordinal day number of 1970-01-01, the epoch of numpy datetime64
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+#person positions are combined with day numbers (below 10**7 for any year up to 9999) into one sortable key
+_PERSON_KEY = 10 ** 7
+
+
+def _ordinal_dates(values) -> np.ndarray:
+    """ISO dates (yyyy-mm-dd) of an array of ordinal day numbers, None where there is no day number."""
+    values = np.asarray(values, dtype=float)
+    known = ~np.isnan(values)
+    dates = np.full(len(values), None, dtype=object)
+    dates[known] = (values[known] - _EPOCH_ORDINAL).astype('int64').astype('datetime64[D]').astype(str)
+    return dates
+
+
+@dataclass(eq=False)
+class Timeline:
+    """
+    The dated instances of all persons as one table of intervals, sorted by person, start and end.
+    An interval runs from the first possible day of startDate to the last possible day of endDate (using the numeric bounds
+    of ColumnarPersonList, so the _min/_max fields come first). Without an endDate it ends on the last possible day of
+    startDate, and without a startDate it starts on the first possible day of endDate.
+    start_certain and end_certain are the days the interval surely covers, from the other bound of each date.
+    Days are ordinal day numbers; to_csv writes them as ISO dates. Instances without any date are only counted in undated
+    (per person position and URI).
+    """
+    intervals: pd.DataFrame
+    undated: pd.Series
+
+    @classmethod
+    def from_columns(cls, columns: 'ColumnarPersonList', attributes: Optional[dict] = None) -> 'Timeline':
+        """
+        Build the timeline of all persons at once.
+
+        Args:
+            columns: the persons as a ColumnarPersonList
+            attributes: the Person lists to use and the field that names their intervals (defaults to TIMELINE_FIELDS)
+        """
+        if attributes is None:
+            attributes = TIMELINE_FIELDS
+        uris = columns.persons['URI'].to_numpy()
+
+        parts = []
+        for attribute_name, value_field in attributes.items():
+            table = columns._table(attribute_name, value_field)
+            if 'startDate' not in table.columns:
+                raise AttributeError(f"{attribute_name} has no dates to build a timeline from")
+
+            start_lower, start_upper = table['startDate_lower'].to_numpy(), table['startDate_upper'].to_numpy()
+            end_lower, end_upper = table['endDate_lower'].to_numpy(), table['endDate_upper'].to_numpy()
+            has_start, has_end = ~np.isnan(start_lower), ~np.isnan(end_upper)
+            person = table['person'].to_numpy()
+
+            parts.append(pd.DataFrame({
+                'person': person,
+                'URI': uris[person],
+                'attribute': attribute_name,
+                'row': np.arange(len(table)),
+                'observation_id': table['observation_id'].astype(object).to_numpy(),
+                'value': table[value_field].astype(object).to_numpy(),
+                'location': table['location'].astype(object).to_numpy() if 'location' in table.columns else None,
+                'start': np.where(has_start, start_lower, end_lower),
+                'end': np.where(has_end, end_upper, start_upper),
+                'start_certain': np.where(has_start, start_upper, end_lower),
+                'end_certain': np.where(has_end, end_lower, start_upper),
+            }))
+
+        frame = pd.concat([part for part in parts if len(part)], ignore_index=True) if any(len(part) for part in parts) \
+            else pd.DataFrame({column: pd.Series(dtype=float if column.startswith(('start', 'end')) else object)
+                               for column in _TIMELINE_COLUMNS})
+
+        #a bound can be missing when only one of the _min/_max fields is filled in
+        frame['end'] = frame['end'].fillna(frame['start'])
+        dated = frame['start'].notna().to_numpy()
+        undated = frame.loc[~dated].groupby(['person', 'URI']).size().rename('undated')
+        frame = frame.loc[dated]
+        order = np.lexsort((frame['end'].to_numpy(), frame['start'].to_numpy(), frame['person'].to_numpy()))
+        return cls(frame.iloc[order].reset_index(drop=True), undated)
+
+    def _keys(self, bound: str) -> np.ndarray:
+        """One sortable number per interval from its person and a bound."""
+        return self.intervals['person'].to_numpy().astype('int64') * _PERSON_KEY + self.intervals[bound].to_numpy().astype('int64')
+
+    def of(self, uri: str) -> pd.DataFrame:
+        """The sorted intervals of one person."""
+        return self.intervals[self.intervals['URI'] == uri]
+
+    def gaps(self, min_days: int = 1) -> pd.DataFrame:
+        """
+        The periods between intervals in which a person has no interval, at least min_days long.
+        Every gap lies between the latest end so far and the start of the next interval (next, a position in intervals).
+        """
+        person = self.intervals['person'].to_numpy()
+        start = self.intervals['start'].to_numpy()
+        reach = self.intervals.groupby('person', sort=False)['end'].cummax().to_numpy()
+
+        #compare every interval with the furthest end of the earlier intervals of the same person
+        follows = np.zeros(len(person), dtype=bool)
+        follows[1:] = person[1:] == person[:-1]
+        previous = np.full(len(person), np.nan)
+        previous[1:] = reach[:-1]
+        days = start - previous - 1
+        nxt = np.flatnonzero(follows & (days >= min_days))
+
+        return pd.DataFrame({
+            'person': person[nxt],
+            'URI': self.intervals['URI'].to_numpy()[nxt],
+            'start': previous[nxt] + 1,
+            'end': start[nxt] - 1,
+            'days': days[nxt],
+            'next': nxt,
+        })
+
+    def overlaps(self) -> pd.DataFrame:
+        """
+        Every pair of intervals of one person that share at least one day, as positions in intervals (left starts first).
+        The pairs are found with a sorted search per interval, so only intervals that overlap are compared.
+        conflict is 'location' for two different locations at once and 'status' for two different statuses at once;
+        certain is whether the certain days of both intervals overlap too.
+        """
+        intervals = self.intervals
+        ordered = np.flatnonzero((intervals['start'] <= intervals['end']).to_numpy())
+        keys = self._keys('start')[ordered]
+        ends = self._keys('end')[ordered]
+
+        #the intervals starting at or before the end of an interval (and after it in the order) overlap it
+        count = np.searchsorted(keys, ends, side='right') - np.arange(len(ordered)) - 1
+        count = np.maximum(count, 0)
+        left = np.repeat(np.arange(len(ordered)), count)
+        right = left + 1 + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        left, right = ordered[left], ordered[right]
+
+        def column(name):
+            values = intervals[name].to_numpy()
+            return values[left], values[right]
+
+        (_, start_right), (end_left, end_right) = column('start'), column('end')
+        (certain_start_left, certain_start_right), (certain_end_left, certain_end_right) = column('start_certain'), column('end_certain')
+        (attribute_left, attribute_right), (value_left, value_right) = column('attribute'), column('value')
+        location_left, location_right = column('location')
+
+        located = pd.notna(location_left) & pd.notna(location_right)
+        status = (attribute_left == 'statuses') & (attribute_right == 'statuses') & pd.notna(value_left) & pd.notna(value_right)
+        conflict = np.full(len(left), None, dtype=object)
+        conflict[status & (value_left != value_right)] = 'status'
+        conflict[located & (location_left != location_right)] = 'location'
+
+        return pd.DataFrame({
+            'person': intervals['person'].to_numpy()[left],
+            'URI': intervals['URI'].to_numpy()[left],
+            'left': left,
+            'right': right,
+            'start': start_right,
+            'end': np.minimum(end_left, end_right),
+            'conflict': conflict,
+            'certain': np.maximum(certain_start_left, certain_start_right) <= np.minimum(certain_end_left, certain_end_right),
+        })
+
+    def conflicts(self) -> pd.DataFrame:
+        """The overlaps with a conflict, and the intervals that end before they start (conflict 'reversed', left == right)."""
+        overlaps = self.overlaps()
+        reversed_ = np.flatnonzero((self.intervals['start'] > self.intervals['end']).to_numpy())
+        reversed_ = pd.DataFrame({
+            'person': self.intervals['person'].to_numpy()[reversed_],
+            'URI': self.intervals['URI'].to_numpy()[reversed_],
+            'left': reversed_,
+            'right': reversed_,
+            'start': self.intervals['end'].to_numpy()[reversed_],
+            'end': self.intervals['start'].to_numpy()[reversed_],
+            'conflict': 'reversed',
+            'certain': True,
+        })
+        parts = [part for part in (overlaps[overlaps['conflict'].notna()], reversed_) if len(part)]
+        if not parts:
+            return overlaps.iloc[:0]
+        return pd.concat(parts, ignore_index=True).sort_values(['person', 'left', 'right'], kind='stable').reset_index(drop=True)
+
+    def summary(self) -> pd.DataFrame:
+        """Per person: the number of intervals, undated instances, gaps and conflicts, and the first and last day."""
+        #group by person position too, so the persons keep their order
+        by = ['person', 'URI']
+        grouped = self.intervals.groupby(by)
+        summary = pd.DataFrame({
+            'intervals': grouped.size(),
+            'first': grouped['start'].min(),
+            'last': grouped['end'].max(),
+        })
+        summary = summary.join(self.undated, how='outer')
+        summary['gaps'] = self.gaps().groupby(by).size()
+        summary['conflicts'] = self.conflicts().groupby(by).size()
+        counts = ['intervals', 'undated', 'gaps', 'conflicts']
+        summary[counts] = summary[counts].fillna(0).astype(int)
+        return summary.reset_index('person', drop=True)[['intervals', 'undated', 'gaps', 'conflicts', 'first', 'last']]
+
+    @staticmethod
+    def _with_dates(frame: pd.DataFrame, columns: list) -> pd.DataFrame:
+        """A copy of a frame with day number columns written as ISO dates."""
+        frame = frame.copy()
+        for name in columns:
+            frame[name] = _ordinal_dates(frame[name])
+        return frame
+
+    def to_csv(self, directory='.') -> List[str]:
+        """
+        Write the intervals, gaps, conflicts and summary as timeline.csv, timeline_gaps.csv, timeline_conflicts.csv
+        and timeline_summary.csv, with ISO dates instead of day numbers.
+
+        Returns:
+            list: the paths of the written files
+        """
+        os.makedirs(directory, exist_ok=True)
+        tables = {
+            'timeline.csv': self._with_dates(self.intervals, ['start', 'end', 'start_certain', 'end_certain']),
+            'timeline_gaps.csv': self._with_dates(self.gaps(), ['start', 'end']),
+            'timeline_conflicts.csv': self._with_dates(self.conflicts(), ['start', 'end']),
+            'timeline_summary.csv': self._with_dates(self.summary(), ['first', 'last']),
+        }
+        paths = []
+        for filename, frame in tables.items():
+            path = os.path.join(directory, filename)
+            frame.to_csv(path, index=filename == 'timeline_summary.csv', encoding="UTF-8")
+            paths.append(path)
+        return paths
+
+
+# In[ ]:
+
+
 
 
@@ -41,6 +41,7 @@ CREATE TABLE IF NOT EXISTS "appellations" (
     "URI" TEXT,
     "observation_id" TEXT,
     "reconstruction_id" TEXT,
+    "original_label" TEXT,
     "appellation" TEXT,
     "appellationType" INT,
     "annotationDate" TEXT,
@@ -360,5 +361,30 @@ SELECT
     COALESCE(endDate, endDate_max) AS effectiveEndDate
 FROM events;
 
+-- Full-text index over the name fields of appellations, kept in sync by the triggers below
+CREATE VIRTUAL TABLE IF NOT EXISTS appellations_fts USING fts5(
+    appellation,
+    original_label,
+    toponym,
+    content='appellations',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS appellations_fts_insert AFTER INSERT ON appellations BEGIN
+    INSERT INTO appellations_fts(rowid, appellation, original_label, toponym)
+    VALUES (new.id, new.appellation, new.original_label, new.toponym);
+END;
 
+CREATE TRIGGER IF NOT EXISTS appellations_fts_delete AFTER DELETE ON appellations BEGIN
+    INSERT INTO appellations_fts(appellations_fts, rowid, appellation, original_label, toponym)
+    VALUES ('delete', old.id, old.appellation, old.original_label, old.toponym);
+END;
 
+CREATE TRIGGER IF NOT EXISTS appellations_fts_update AFTER UPDATE ON appellations BEGIN
+    INSERT INTO appellations_fts(appellations_fts, rowid, appellation, original_label, toponym)
+    VALUES ('delete', old.id, old.appellation, old.original_label, old.toponym);
+    INSERT INTO appellations_fts(rowid, appellation, original_label, toponym)
+    VALUES (new.id, new.appellation, new.original_label, new.toponym);
+END;